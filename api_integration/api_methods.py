@@ -2,55 +2,138 @@
 import base64
 import os
 import sys
-from typing import Any, Optional
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, List, Optional
 
-from fastapi import FastAPI, HTTPException, Response
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field, field_validator
 import uvicorn
 from validation.nodes_settings import *
-from config import API_HOST, API_PORT
+from config import API_HOST, API_PORT, TRAFFIC_CAPTURE_PATH, ADMIN_TOKEN, LOOP_LAG_MONITOR
 # Добавляем путь к модулям проекта
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from services.workflow_service_v3 import LocalComfyUIClient, ProcessType
+from services.prompt_scheduler import Priority
+from services.job_ledger import get_job_ledger
+from services.cleanup import cleanup_stats, stop_cleanups
+from api_integration.profiling import LoopLagMonitor, ProfilingMiddleware, is_admin
 
 # Или, если используется другой класс, например:
 # from workflow_controller import WorkflowController
 
+loop_lag_monitor: Optional[LoopLagMonitor] = LoopLagMonitor() if LOOP_LAG_MONITOR else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Фоновые службы: монитор event loop при старте; при остановке — сброс журнала и очистка."""
+    if loop_lag_monitor is not None:
+        loop_lag_monitor.start()
+    try:
+        yield
+    finally:
+        if loop_lag_monitor is not None:
+            await loop_lag_monitor.stop()
+        # Дописать буфер журнала генераций
+        ledger = get_job_ledger()
+        if ledger is not None:
+            await ledger.stop()
+        # Удалить накопленную историю ComfyUI последним проходом очистки
+        await stop_cleanups()
+
+
 app = FastAPI(
     title="ComfyUI Workflow API",
     description="API для выполнения workflow ComfyUI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+if ADMIN_TOKEN:
+    # Профилирование запроса по заголовкам X-Profile + X-Admin-Token
+    app.add_middleware(ProfilingMiddleware)
 
-class PortraitRequest(BaseModel):
-    """Запрос на генерацию портрета."""
+
+class PortraitBatchRequest(BaseModel):
+    """Запрос на генерацию портрета (params.batch_size изображений, эндпоинты /images)."""
     timeout: int = Field(20, description="Таймаут выполнения workflow в секундах")
+    priority: Priority = Field(
+        Priority.INTERACTIVE,
+        description="Полоса очереди: interactive (в начало очереди ComfyUI) или bulk (фоновая генерация)",
+    )
     params: PortraitParams = Field(  # type: ignore[name-defined]
         default_factory=PortraitParams,
         description="Параметры генерации портрета (дефолты см. в PortraitParams)",
     )
 
 
-class PoseRequest(BaseModel):
-    """Запрос на генерацию позы."""
+class PoseBatchRequest(BaseModel):
+    """Запрос на генерацию позы (params.batch_size изображений, эндпоинты /images)."""
     timeout: int = Field(20, description="Таймаут выполнения workflow в секундах")
+    priority: Priority = Field(
+        Priority.INTERACTIVE,
+        description="Полоса очереди: interactive (в начало очереди ComfyUI) или bulk (фоновая генерация)",
+    )
     params: PoseParams = Field(  # type: ignore[name-defined]
         default_factory=PoseParams,
         description="Параметры генерации позы (дефолты см. в PoseParams)",
     )
 
 
-class PoseDetailRequest(BaseModel):
-    """Запрос на генерацию позы с детайлером."""
+class PoseDetailBatchRequest(BaseModel):
+    """Запрос на генерацию позы с детайлером (params.batch_size изображений, эндпоинты /images)."""
     timeout: int = Field(20, description="Таймаут выполнения workflow в секундах")
+    priority: Priority = Field(
+        Priority.INTERACTIVE,
+        description="Полоса очереди: interactive (в начало очереди ComfyUI) или bulk (фоновая генерация)",
+    )
     params: PoseParams = Field(  # type: ignore[name-defined]
         default_factory=PoseParams,
         description="Параметры генерации позы для детайлера (дефолты см. в PoseParams)",
     )
 
 
+def _require_single_image(params: BaseProcessParams) -> BaseProcessParams:
+    """Эндпоинты /image возвращают одно изображение — лишние латенты GPU не сэмплирует."""
+    if params.batch_size != 1:
+        raise ValueError("batch_size > 1 поддерживается только эндпоинтами /images")
+    return params
+
+
+class PortraitRequest(PortraitBatchRequest):
+    """Запрос на генерацию портрета."""
+
+    _single_image = field_validator("params")(_require_single_image)
+
+
+class PoseRequest(PoseBatchRequest):
+    """Запрос на генерацию позы."""
+
+    _single_image = field_validator("params")(_require_single_image)
+
+
+class PoseDetailRequest(PoseDetailBatchRequest):
+    """Запрос на генерацию позы с детайлером."""
+
+    _single_image = field_validator("params")(_require_single_image)
+
+
+class GeneratedImage(BaseModel):
+    """Одно изображение из батча."""
+    filename: str
+    subfolder: str = ""
+    image_base64: str = Field(..., description="PNG в base64")
+
+
+class ImagesResponse(BaseModel):
+    """Все изображения ноды сохранения (batch_size штук)."""
+    prompt_id: str
+    images: List[GeneratedImage]
+
+
 def _result_to_image_bytes(result: Any) -> bytes:
     """Преобразует результат execute_workflow2 (str base64 или bytes) в байты изображения."""
     if isinstance(result, bytes):
@@ -73,17 +156,36 @@ async def _run_workflow_and_return_image(
     params: BaseModel,
     timeout: int,
     service: LocalComfyUIClient,
+    priority: Priority = Priority.INTERACTIVE,
 ) -> Response:
     """Общий помощник: выполняет workflow и возвращает PNG-изображение."""
     print("CLIENT ID: ", service.client_id)
-
-    result = await service.execute_workflow2(
-        process_type=process_type,
-        params=params.model_dump(),
-        timeout=timeout,
-    )
-    image_bytes = _result_to_image_bytes(result)
     filename = f"{process_type.value}.png"
+
+    if service.output_storage is not None:
+        # Файл на общем диске отдаём через sendfile, без буферизации в памяти
+        result = await service.execute_workflow_file(
+            process_type=process_type,
+            params=params.model_dump(),
+            timeout=timeout,
+            priority=priority,
+        )
+        if isinstance(result, Path):
+            return FileResponse(
+                result,
+                media_type="image/png",
+                headers={"Content-Disposition": f"inline; filename={filename}"},
+            )
+        image_bytes = result
+    else:
+        result = await service.execute_workflow2(
+            process_type=process_type,
+            params=params.model_dump(),
+            timeout=timeout,
+            priority=priority,
+        )
+        image_bytes = _result_to_image_bytes(result)
+
     return Response(
         content=image_bytes,
         media_type="image/png",
@@ -91,6 +193,33 @@ async def _run_workflow_and_return_image(
     )
 
 
+async def _run_workflow_and_return_images(
+    process_type: ProcessType,
+    params: BaseModel,
+    timeout: int,
+    service: LocalComfyUIClient,
+    priority: Priority = Priority.INTERACTIVE,
+) -> ImagesResponse:
+    """Общий помощник: выполняет workflow с batch_size > 1 и возвращает все изображения."""
+    result = await service.execute_workflow_batch(
+        process_type=process_type,
+        params=params.model_dump(),
+        timeout=timeout,
+        priority=priority,
+    )
+    return ImagesResponse(
+        prompt_id=result.prompt_id,
+        images=[
+            GeneratedImage(
+                filename=image.filename,
+                subfolder=image.subfolder,
+                image_base64=base64.b64encode(data).decode("utf-8"),
+            )
+            for image, data in zip(result.images, result.data)
+        ],
+    )
+
+
 @app.post(
     "/api/v1/get_portait/image",
     responses={200: {"content": {"image/png": {}}, "description": "Возвращает PNG изображение"}},
@@ -104,6 +233,7 @@ async def get_portrait_image(request: PortraitRequest):
             params=request.params,
             timeout=request.timeout,
             service=service,
+            priority=request.priority,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -122,6 +252,7 @@ async def get_pose_image(request: PoseRequest):
             params=request.params,
             timeout=request.timeout,
             service=service,
+            priority=request.priority,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -140,11 +271,96 @@ async def get_pose_dt_image(request: PoseDetailRequest):
             params=request.params,
             timeout=request.timeout,
             service=service,
+            priority=request.priority,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/v1/get_portait/images", response_model=ImagesResponse)
+async def get_portrait_images(request: PortraitBatchRequest):
+    """Возвращает все изображения портрета (params.batch_size за один проход)."""
+    service = LocalComfyUIClient()
+    try:
+        return await _run_workflow_and_return_images(
+            ProcessType.PORTRAIT,
+            params=request.params,
+            timeout=request.timeout,
+            service=service,
+            priority=request.priority,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/get_pose/images", response_model=ImagesResponse)
+async def get_pose_images(request: PoseBatchRequest):
+    """Возвращает все изображения позы (params.batch_size за один проход)."""
+    service = LocalComfyUIClient()
+    try:
+        return await _run_workflow_and_return_images(
+            ProcessType.POSE,
+            params=request.params,
+            timeout=request.timeout,
+            service=service,
+            priority=request.priority,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/get_pose_dt/images", response_model=ImagesResponse)
+async def get_pose_dt_images(request: PoseDetailBatchRequest):
+    """Возвращает все изображения позы с детайлером (params.batch_size за один проход)."""
+    service = LocalComfyUIClient()
+    try:
+        return await _run_workflow_and_return_images(
+            ProcessType.POSE_DT,
+            params=request.params,
+            timeout=request.timeout,
+            service=service,
+            priority=request.priority,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+if TRAFFIC_CAPTURE_PATH:
+    from api_integration.traffic_capture import TrafficCaptureMiddleware
+
+    # Запись запросов генерации для replay: тело валидируется моделью эндпоинта
+    app.add_middleware(
+        TrafficCaptureMiddleware,
+        path=TRAFFIC_CAPTURE_PATH,
+        models={
+            "/api/v1/get_portait/image": PortraitRequest,
+            "/api/v1/get_pose/image": PoseRequest,
+            "/api/v1/get_pose_dt/image": PoseDetailRequest,
+            "/api/v1/get_portait/images": PortraitBatchRequest,
+            "/api/v1/get_pose/images": PoseBatchRequest,
+            "/api/v1/get_pose_dt/images": PoseDetailBatchRequest,
+        },
+    )
+
+
+@app.get("/api/v1/admin/loop_lag")
+async def get_loop_lag(x_admin_token: Optional[str] = Header(None)):
+    """Гистограмма задержек event loop (только для администратора)."""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if loop_lag_monitor is None:
+        raise HTTPException(status_code=404, detail="Loop lag monitor is disabled")
+    return loop_lag_monitor.snapshot()
+
+
+@app.get("/api/v1/admin/cleanup")
+async def get_cleanup_stats(x_admin_token: Optional[str] = Header(None)):
+    """Счётчики очистки истории и output ComfyUI (только для администратора)."""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return cleanup_stats()
+
+
 @app.get("/api/v1/health")
 async def health_check():
     """Проверка работоспособности сервиса"""
@@ -0,0 +1,180 @@
+"""
+Диагностика производительности API.
+
+- ProfilingMiddleware: профилирование одного запроса через cProfile по заголовкам
+  X-Profile: 1 и X-Admin-Token: <ADMIN_TOKEN>. Отчёт (.prof и текстовая сводка)
+  сохраняется в PROFILE_DIR, имя файла возвращается в заголовке X-Profile-Report.
+- LoopLagMonitor: постоянный замер задержек event loop с гистограммой; если loop
+  заблокирован дольше порога, сторожевой поток логирует стек блокирующего кода.
+
+Оба механизма подключаются только при соответствующих настройках — без них
+накладных расходов нет.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from config import ADMIN_TOKEN, LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+# Значения X-Profile, включающие профилирование (как булевы настройки в config.py)
+PROFILE_FLAG_VALUES = {b"1", b"true", b"yes"}
+
+
+def is_admin(token: Union[str, bytes, None], admin_token: str = ADMIN_TOKEN) -> bool:
+    """
+    Проверка токена администратора (пустой ADMIN_TOKEN — доступ закрыт).
+
+    Сравниваются байты: hmac.compare_digest не принимает str с не-ASCII символами.
+    token — сырой заголовок (bytes) или str от Starlette, декодированный как latin-1.
+    """
+    if not admin_token or token is None:
+        return False
+    if isinstance(token, str):
+        try:
+            token = token.encode("latin-1")
+        except UnicodeEncodeError:
+            token = token.encode("utf-8")
+    return hmac.compare_digest(token, admin_token.encode("utf-8"))
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: запрос с X-Profile и верным X-Admin-Token выполняется под cProfile.
+
+    cProfile работает на весь поток event loop, поэтому в отчёт попадают и
+    параллельные запросы; одновременно профилируется только один запрос.
+    """
+
+    def __init__(self, app, admin_token: str = ADMIN_TOKEN, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.admin_token = admin_token
+        self.profile_dir = Path(profile_dir)
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile", b"").strip().lower() not in PROFILE_FLAG_VALUES or not is_admin(headers.get(b"x-admin-token"), self.admin_token):
+            return await self.app(scope, receive, send)
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{scope['path'].strip('/').replace('/', '_') or 'root'}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-report", name.encode("latin-1"))
+                ]
+            await send(message)
+
+        self._busy = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            self._busy = False
+            await asyncio.to_thread(self._save, profiler, name)
+
+    def _save(self, profiler: cProfile.Profile, name: str) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.profile_dir / f"{name}.prof")
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(50)
+        (self.profile_dir / f"{name}.txt").write_text(summary.getvalue(), encoding="utf-8")
+        logger.info("Profile saved: %s", self.profile_dir / name)
+
+
+class LoopLagMonitor:
+    """
+    Замер задержки event loop: тик каждые interval секунд, отставание тика
+    попадает в гистограмму. Сторожевой поток следит за последним тиком и,
+    если loop стоит дольше threshold, логирует текущий стек потока loop.
+    """
+
+    # Верхние границы корзин гистограммы, секунды
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.counts = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.max = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Запустить мониторинг (вызывать из работающего event loop)"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def observe(self, lag: float) -> None:
+        for i, bound in enumerate(self.BUCKETS):
+            if lag <= bound:
+                self.counts[i] += 1
+                break
+        self.total += lag
+        self.max = max(self.max, lag)
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, loop.time() - expected))
+            self._heartbeat = time.monotonic()
+
+    def _watch(self) -> None:
+        reported = 0.0
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled <= self.threshold or reported == heartbeat:
+                continue
+            # Логируем один раз на каждую блокировку
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+            logger.warning("Event loop blocked for %.3fs, stack:\n%s", stalled, stack)
+
+    def snapshot(self) -> Dict[str, object]:
+        """Гистограмма в формате Prometheus (накопительные корзины le)"""
+        buckets, cumulative = {}, 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"buckets": buckets, "count": cumulative, "sum": round(self.total, 6), "max": round(self.max, 6)}
@@ -0,0 +1,155 @@
+"""
+Воспроизведение записанного трафика (см. api_integration/traffic_capture.py).
+
+Примеры:
+    python -m api_integration.replay traffic.jsonl                   # исходная скорость
+    python -m api_integration.replay traffic.jsonl --speed 4         # в 4 раза быстрее
+    python -m api_integration.replay traffic.jsonl --max-rate -c 8   # без пауз, 8 параллельно
+
+В конце печатает перцентили латентности по эндпоинтам (тип процесса / image или images).
+В режиме --speed латентность считается от запланированного времени отправки,
+поэтому ожидание свободного слота (-c) входит в замер и не прячет перегрузку.
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from config import API_PORT
+
+
+def load_capture(paths: List[str]) -> List[Dict[str, Any]]:
+    """Прочитать записи из одного или нескольких JSONL-файлов, отсортировать по времени"""
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+# Эндпоинт -> (тип процесса, вид ответа); пути API сохраняют историческую опечатку "portait"
+ENDPOINTS: Dict[str, Tuple[str, str]] = {
+    "/api/v1/get_portait/image": ("portrait", "image"),
+    "/api/v1/get_pose/image": ("pose", "image"),
+    "/api/v1/get_pose_dt/image": ("pose_dt", "image"),
+    "/api/v1/get_portait/images": ("portrait", "images"),
+    "/api/v1/get_pose/images": ("pose", "images"),
+    "/api/v1/get_pose_dt/images": ("pose_dt", "images"),
+}
+
+
+def endpoint_label(endpoint: str) -> str:
+    """/api/v1/get_pose_dt/images -> pose_dt/images (неизвестный эндпоинт — как есть)"""
+    if endpoint not in ENDPOINTS:
+        return endpoint
+    process_type, kind = ENDPOINTS[endpoint]
+    return f"{process_type}/{kind}"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом nearest-rank"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def replay(
+        records: List[Dict[str, Any]],
+        base_url: str,
+        speed: Optional[float] = 1.0,
+        concurrency: int = 16,
+        request_timeout: float = 600.0,
+) -> Dict[str, Dict[str, List[float]]]:
+    """
+    Переотправить запросы. speed=None — максимальная скорость (ограничена concurrency),
+    иначе паузы между запросами как в записи, делённые на speed.
+
+    В режиме speed время считается от запланированного момента отправки (без
+    coordinated omission); при speed=None — от получения слота семафора.
+    """
+    results: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: {"ok": [], "error": []})
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=request_timeout)
+
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async def send(record: Dict[str, Any], scheduled: Optional[float]) -> None:
+            async with semaphore:
+                start = time.perf_counter() if scheduled is None else scheduled
+                try:
+                    async with session.post(f"{base_url}{record['e']}", json=record["p"]) as resp:
+                        await resp.read()
+                        ok = resp.status == 200
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                elapsed = time.perf_counter() - start
+                results[endpoint_label(record["e"])]["ok" if ok else "error"].append(elapsed)
+
+        tasks = []
+        if records:
+            t0 = records[0]["t"]
+            started = time.perf_counter()
+            for record in records:
+                scheduled = None
+                if speed:
+                    scheduled = started + (record["t"] - t0) / speed
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(send(record, scheduled)))
+        await asyncio.gather(*tasks)
+
+    return results
+
+
+def format_report(results: Dict[str, Dict[str, List[float]]], wall_time: float) -> str:
+    """Таблица латентностей (секунды) по эндпоинтам"""
+    lines = [f"{'endpoint':<16}{'ok':>6}{'err':>6}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+    total = 0
+    for name in sorted(results):
+        ok, err = results[name]["ok"], results[name]["error"]
+        total += len(ok) + len(err)
+        stats = [percentile(ok, q) for q in (50, 90, 95, 99)] + [max(ok) if ok else float("nan")]
+        lines.append(f"{name:<16}{len(ok):>6}{len(err):>6}" + "".join(f"{v:>9.3f}" for v in stats))
+    lines.append(f"{total} requests in {wall_time:.1f}s ({total / wall_time if wall_time else 0:.2f} req/s)")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured API traffic")
+    parser.add_argument("capture", nargs="+", help="JSONL-файлы записи (включая ротированные .1, .2, ...)")
+    parser.add_argument("--base-url", default=f"http://localhost:{API_PORT}")
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument("--speed", type=float, default=1.0, help="Множитель скорости (1 — как в записи)")
+    speed.add_argument("--max-rate", action="store_true", help="Без пауз между запросами")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=None, help="Воспроизвести только первые N запросов")
+    args = parser.parse_args()
+
+    records = load_capture(args.capture)[:args.limit]
+    started = time.perf_counter()
+    results = asyncio.run(replay(
+        records,
+        args.base_url.rstrip("/"),
+        speed=None if args.max_rate else args.speed,
+        concurrency=args.concurrency,
+    ))
+    print(format_report(results, time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Запись входящего трафика API в JSONL для воспроизведения (см. api_integration/replay.py).
+
+Одна строка — один запрос:
+    {"t": 1760000000.123, "e": "/api/v1/get_pose/image", "p": {...параметры запроса...}}
+
+t — время поступления (unix, секунды), e — эндпоинт, p — запрос после валидации
+моделью эндпоинта (model_dump со всеми значениями по умолчанию), поэтому
+воспроизведение не зависит от того, как изменятся умолчания в API.
+Записываются только запросы, прошедшие валидацию (ответ не 422).
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+from config import (
+    TRAFFIC_CAPTURE_BACKUP_COUNT,
+    TRAFFIC_CAPTURE_MAX_BYTES,
+    TRAFFIC_CAPTURE_SAMPLE_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+class TrafficCaptureMiddleware:
+    """
+    ASGI middleware: записывает POST-запросы генерации с семплированием и ротацией файла.
+
+    models — эндпоинты для записи и модели их запросов; остальные пути пропускаются.
+
+    Запись в файл идёт через QueueHandler/QueueListener в отдельном потоке,
+    поэтому путь запроса не блокируется на диске.
+    """
+
+    def __init__(
+            self,
+            app,
+            path: str,
+            models: Dict[str, Type[BaseModel]],
+            sample_rate: float = TRAFFIC_CAPTURE_SAMPLE_RATE,
+            max_bytes: int = TRAFFIC_CAPTURE_MAX_BYTES,
+            backup_count: int = TRAFFIC_CAPTURE_BACKUP_COUNT,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.models = dict(models)
+
+        file_handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._listener = QueueListener(log_queue, file_handler)
+        self._listener.start()
+        self._closed = False
+        atexit.register(self.close)
+
+        self._capture_logger = logging.getLogger(f"{__name__}.{id(self)}")
+        self._capture_logger.propagate = False
+        self._capture_logger.setLevel(logging.INFO)
+        self._capture_logger.addHandler(QueueHandler(log_queue))
+
+    def _should_capture(self, scope) -> bool:
+        return (
+                scope["type"] == "http"
+                and scope["method"] == "POST"
+                and scope["path"] in self.models
+                and random.random() < self.sample_rate
+        )
+
+    async def __call__(self, scope, receive, send):
+        if not self._should_capture(scope):
+            return await self.app(scope, receive, send)
+
+        arrived = time.time()
+        body = bytearray()
+        status: Optional[int] = None
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            if status is not None and status != 422:
+                self._record(arrived, scope["path"], bytes(body))
+
+    def _record(self, arrived: float, endpoint: str, body: bytes) -> None:
+        try:
+            request = self.models[endpoint].model_validate_json(body or b"{}")
+        except ValidationError:
+            return
+        params = request.model_dump(mode="json")
+        line = json.dumps(
+            {"t": round(arrived, 3), "e": endpoint, "p": params},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        self._capture_logger.info(line)
+
+    def close(self) -> None:
+        """Дописать очередь и закрыть файл"""
+        if self._closed:
+            return
+        self._closed = True
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
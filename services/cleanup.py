@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from config import (
+    CLEANUP_HISTORY,
+    CLEANUP_INTERVAL,
+    OUTPUT_RETENTION_MAX_AGE,
+    OUTPUT_RETENTION_MAX_BYTES,
+    OUTPUT_RETENTION_MAX_FILES,
+)
+from services.output_storage import LocalOutputStorage
+
+logger = logging.getLogger(__name__)
+
+# Файлы, которые ComfyUI пишет в output и которые можно удалять
+OUTPUT_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+@dataclass
+class RetentionPolicy:
+    """Ограничения на файлы в output (0 — ограничение выключено)"""
+    max_age: float = OUTPUT_RETENTION_MAX_AGE
+    max_files: int = OUTPUT_RETENTION_MAX_FILES
+    max_bytes: int = OUTPUT_RETENTION_MAX_BYTES
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age or self.max_files or self.max_bytes)
+
+
+@dataclass
+class CleanupStats:
+    """Счётчики очистки"""
+    history_deleted: int = 0
+    history_errors: int = 0
+    files_deleted: int = 0
+    bytes_reclaimed: int = 0
+
+
+class ComfyUICleanup:
+    """
+    Фоновая очистка ComfyUI после выдачи результата.
+
+    schedule(prompt_id) только запоминает промпт. Раз в interval секунд фоновая
+    задача одним запросом POST /history {"delete": [...]} удаляет накопившиеся
+    записи истории и применяет политику хранения к файлам в output.
+    """
+
+    def __init__(
+            self,
+            base_url: str,
+            output_storage: Optional[LocalOutputStorage] = None,
+            policy: Optional[RetentionPolicy] = None,
+            interval: float = CLEANUP_INTERVAL,
+            delete_history: bool = CLEANUP_HISTORY,
+    ):
+        self.base_url = base_url
+        self.output_storage = output_storage
+        self.policy = policy or RetentionPolicy()
+        self.interval = interval
+        self.delete_history = delete_history
+        self.stats = CleanupStats()
+        self._pending: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, prompt_id: str) -> None:
+        """Отметить промпт как выданный (не блокирует, работа выполняется в фоне)"""
+        if self.delete_history:
+            self._pending.add(prompt_id)
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        if not self.delete_history and not (self.output_storage and self.policy.enabled):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("ComfyUI cleanup failed")
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и выполнить последний проход"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.run_once()
+
+    async def run_once(self) -> None:
+        """Один проход очистки: история пачкой, затем файлы в output"""
+        await self._flush_history()
+        if self.output_storage is not None and self.policy.enabled:
+            for root in self.output_storage.roots.values():
+                files, reclaimed = await asyncio.to_thread(apply_retention, root, self.policy)
+                self.stats.files_deleted += files
+                self.stats.bytes_reclaimed += reclaimed
+
+    async def _flush_history(self) -> None:
+        if not self._pending:
+            return
+        batch = list(self._pending)
+        self._pending.difference_update(batch)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                        f"{self.base_url}/history",
+                        json={"delete": batch}
+                ) as resp:
+                    if resp.status != 200:
+                        raise RuntimeError(f"Failed to delete history: {resp.status}")
+        except Exception as e:
+            # Вернём промпты в очередь — попробуем на следующем проходе
+            self._pending.update(batch)
+            self.stats.history_errors += 1
+            logger.warning("History cleanup failed (%d pending): %s", len(self._pending), e)
+            return
+        self.stats.history_deleted += len(batch)
+        logger.debug("Deleted %d history entries", len(batch))
+
+
+def apply_retention(root: Path, policy: RetentionPolicy, now: Optional[float] = None) -> Tuple[int, int]:
+    """
+    Удалить файлы из root по политике (сначала самые старые).
+    Возвращает (количество удалённых файлов, освобождено байт).
+    """
+    now = time.time() if now is None else now
+    entries: List[Tuple[float, int, Path]] = []
+    for path in root.rglob("*"):
+        if path.suffix.lower() not in OUTPUT_SUFFIXES:
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if path.is_file():
+            entries.append((st.st_mtime, st.st_size, path))
+    # Новые в начале: всё, что не укладывается в лимиты, — в хвосте
+    entries.sort(key=lambda e: e[0], reverse=True)
+
+    deleted, reclaimed = 0, 0
+    kept_files, kept_bytes = 0, 0
+    for mtime, size, path in entries:
+        expired = (
+                (policy.max_age and now - mtime > policy.max_age)
+                or (policy.max_files and kept_files >= policy.max_files)
+                or (policy.max_bytes and kept_bytes + size > policy.max_bytes)
+        )
+        if not expired:
+            kept_files += 1
+            kept_bytes += size
+            continue
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.warning("Failed to delete %s: %s", path, e)
+            continue
+        deleted += 1
+        reclaimed += size
+
+    if deleted:
+        logger.info("Output retention: deleted %d files, reclaimed %d bytes in %s", deleted, reclaimed, root)
+    return deleted, reclaimed
+
+
+_cleanups: Dict[str, ComfyUICleanup] = {}
+
+
+def get_cleanup(base_url: str, output_storage: Optional[LocalOutputStorage] = None) -> ComfyUICleanup:
+    """Общий сервис очистки для каждого ComfyUI сервера (на процесс)"""
+    cleanup = _cleanups.get(base_url)
+    if cleanup is None:
+        cleanup = _cleanups[base_url] = ComfyUICleanup(base_url, output_storage)
+        if cleanup.policy.enabled and output_storage is None:
+            logger.warning("OUTPUT_RETENTION_* is set but COMFYUI_OUTPUT_DIR is not: output retention is disabled")
+    elif cleanup.output_storage is None and output_storage is not None:
+        cleanup.output_storage = output_storage
+    return cleanup
+
+
+async def stop_cleanups() -> None:
+    """Остановить очистку всех серверов с последним проходом (при остановке приложения)"""
+    for cleanup in list(_cleanups.values()):
+        try:
+            await cleanup.stop()
+        except Exception:
+            logger.exception("ComfyUI cleanup failed on shutdown (%s)", cleanup.base_url)
+
+
+def cleanup_stats() -> Dict[str, Dict[str, int]]:
+    """Счётчики очистки по серверам ComfyUI"""
+    return {
+        base_url: {**asdict(cleanup.stats), "history_pending": len(cleanup._pending)}
+        for base_url, cleanup in _cleanups.items()
+    }
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import (
+    JOB_LEDGER_BATCH_SIZE,
+    JOB_LEDGER_COLLECTION,
+    JOB_LEDGER_ENABLED,
+    JOB_LEDGER_FLUSH_INTERVAL,
+    JOB_LEDGER_MAX_BUFFER,
+    MONGO_DB_NAME,
+    get_mongo_uri,
+)
+
+logger = logging.getLogger(__name__)
+
+# Индекс для выборок по типу процесса, времени и параметрам
+LEDGER_INDEX = [("process_type", 1), ("created_at", 1), ("params_hash", 1)]
+
+
+def params_hash(params: Optional[Dict[str, Any]]) -> str:
+    """Стабильный хэш параметров (порядок ключей не важен)"""
+    canonical = json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class JobRecord:
+    """Запись о генерации"""
+    process_type: str
+    params_hash: str
+    backend: str
+    priority: str = "interactive"
+    prompt_id: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    timings: Dict[str, float] = field(default_factory=dict)
+    outputs: List[str] = field(default_factory=list)
+    outcome: str = "pending"
+    error: Optional[str] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Замерить длительность этапа (секунды) в timings[name]"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - start, 4)
+
+    def to_document(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class InMemoryLedgerBackend:
+    """Хранилище в памяти (для тестов и локального запуска)"""
+
+    def __init__(self):
+        self.documents: List[Dict[str, Any]] = []
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+    async def insert_many(self, documents: List[Dict[str, Any]]) -> None:
+        self.documents.extend(documents)
+
+    def find(self, **filters) -> List[Dict[str, Any]]:
+        return [d for d in self.documents if all(d.get(k) == v for k, v in filters.items())]
+
+
+class MongoLedgerBackend:
+    """Хранилище в MongoDB через motor"""
+
+    def __init__(self, uri: Optional[str] = None, db_name: str = MONGO_DB_NAME, collection: str = JOB_LEDGER_COLLECTION):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(uri or get_mongo_uri())
+        self.collection = self.client[db_name][collection]
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index(LEDGER_INDEX, name="process_type_created_at_params_hash")
+
+    async def insert_many(self, documents: List[Dict[str, Any]]) -> None:
+        # ordered=False: ошибка одного документа не останавливает остальные
+        await self.collection.insert_many(documents, ordered=False)
+
+
+class JobLedger:
+    """
+    Асинхронный журнал генераций.
+
+    record() только кладёт запись в буфер и никогда не ждёт БД. Фоновая задача
+    сбрасывает буфер пачками insert_many, когда набралось batch_size записей или
+    прошло flush_interval секунд. Если буфер переполнен (БД не успевает),
+    новые записи отбрасываются и считаются в dropped.
+    """
+
+    def __init__(
+            self,
+            backend,
+            batch_size: int = JOB_LEDGER_BATCH_SIZE,
+            flush_interval: float = JOB_LEDGER_FLUSH_INTERVAL,
+            max_buffer: int = JOB_LEDGER_MAX_BUFFER,
+    ):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._indexes_ready = False
+        # Один flush за раз: иначе параллельные вызовы записали бы одну пачку дважды
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, record: JobRecord) -> None:
+        """Добавить запись в буфер (не блокирует)"""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._buffer.append(record.to_document())
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записать всё накопленное пачками по batch_size"""
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._indexes_ready and self._buffer:
+            try:
+                await self.backend.ensure_indexes()
+                self._indexes_ready = True
+            except Exception as e:
+                logger.warning("Job ledger: failed to create indexes: %s", e)
+
+        while self._buffer:
+            # Пачка остаётся в буфере до ответа БД: если flush отменят посреди
+            # insert_many (stop()), её допишет следующий flush
+            batch = self._buffer[:self.batch_size]
+            try:
+                await self.backend.insert_many(batch)
+            except Exception as e:
+                # Не повторяем: журнал не должен копить долг при недоступной БД
+                del self._buffer[:len(batch)]
+                self.failed += len(batch)
+                logger.warning("Job ledger: failed to write %d records: %s", len(batch), e)
+                return
+            del self._buffer[:len(batch)]
+            self.written += len(batch)
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и сбросить буфер"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+_default_ledger: Optional[JobLedger] = None
+
+
+def get_job_ledger() -> Optional[JobLedger]:
+    """Общий журнал процесса (None, если JOB_LEDGER_ENABLED выключен)"""
+    global _default_ledger
+    if _default_ledger is None and JOB_LEDGER_ENABLED:
+        _default_ledger = JobLedger(MongoLedgerBackend())
+    return _default_ledger
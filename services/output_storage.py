@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from config import COMFYUI_OUTPUT_DIR, COMFYUI_TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class OutputAccess(str, Enum):
+    HTTP = "http"
+    FILESYSTEM = "filesystem"
+
+
+class LocalOutputStorage:
+    """
+    Прямой доступ к файлам ComfyUI на общем диске/томе.
+
+    Параметры filename/subfolder/type (как у /view) превращаются в путь внутри
+    корня соответствующего типа. Пути вне корня (../, абсолютные, симлинки наружу)
+    отбрасываются.
+    """
+
+    def __init__(
+            self,
+            output_dir: Union[str, Path] = COMFYUI_OUTPUT_DIR,
+            temp_dir: Union[str, Path, None] = COMFYUI_TEMP_DIR,
+    ):
+        if not output_dir:
+            raise ValueError("output_dir is required for filesystem output access")
+        self.roots: Dict[str, Path] = {"output": Path(output_dir).resolve()}
+        if temp_dir:
+            self.roots["temp"] = Path(temp_dir).resolve()
+
+    def resolve(self, filename: str, subfolder: str = "", type: str = "output") -> Optional[Path]:
+        """Безопасно получить путь к файлу или None, если файла нет или путь вне корня"""
+        root = self.roots.get(type)
+        if root is None or not filename:
+            return None
+
+        try:
+            path = (root / (subfolder or "") / filename).resolve()
+        except (OSError, ValueError):
+            return None
+        if not path.is_relative_to(root):
+            logger.warning("Rejected output path outside of %s root: %s/%s", type, subfolder, filename)
+            return None
+        if not path.is_file():
+            return None
+        return path
+
+    async def read(self, filename: str, subfolder: str = "", type: str = "output") -> Optional[bytes]:
+        """Прочитать файл в отдельном потоке (не блокируя event loop) или None"""
+        path = self.resolve(filename, subfolder, type)
+        if path is None:
+            return None
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except OSError as e:
+            logger.warning("Failed to read %s: %s", path, e)
+            return None
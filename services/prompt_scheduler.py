@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from config import BULK_MAX_INFLIGHT, BULK_STARVATION_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+
+class PromptScheduler:
+    """
+    Клиентский планировщик перед queue_prompt.
+
+    - INTERACTIVE: без ожидания, отправляется сразу с флагом front (в начало
+      очереди ComfyUI); учитывается только счётчиком в stats().
+    - BULK: ждёт в клиентской FIFO-полосе, в очереди ComfyUI одновременно
+      находится не более max_bulk_inflight bulk-промптов.
+    - Защита от голодания: если bulk-промпт, уже отправленный в ComfyUI, стоит
+      там дольше starvation_timeout (его обгоняют front-промпты), интерактивные
+      промпты отправляются без front, пока он не завершится. Ожидание в
+      клиентской полосе сюда не входит — это ограничение max_bulk_inflight.
+    """
+
+    def __init__(
+            self,
+            max_bulk_inflight: int = BULK_MAX_INFLIGHT,
+            starvation_timeout: float = BULK_STARVATION_TIMEOUT,
+    ):
+        if max_bulk_inflight < 1:
+            raise ValueError("max_bulk_inflight must be >= 1")
+        self.max_bulk_inflight = max_bulk_inflight
+        self.starvation_timeout = starvation_timeout
+        self._bulk_lane: Deque[asyncio.Future] = deque()
+        self._inflight: Dict[Priority, int] = {p: 0 for p in Priority}
+        # Время отправки в ComfyUI для выполняющихся bulk-промптов по их номеру
+        self._bulk_submitted_at: Dict[int, float] = {}
+        self._counter = itertools.count()
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_running_loop().time()
+
+    def _bulk_starving(self) -> bool:
+        if not self._bulk_submitted_at:
+            return False
+        oldest = min(self._bulk_submitted_at.values())
+        return self._now() - oldest > self.starvation_timeout
+
+    def _wake_bulk(self) -> None:
+        """Разбудить ожидающие bulk-задачи, если освободились слоты"""
+        lane = self._bulk_lane
+        while lane and self._inflight[Priority.BULK] < self.max_bulk_inflight:
+            waiter = lane.popleft()
+            if waiter.done():
+                continue
+            self._inflight[Priority.BULK] += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[bool]:
+        """
+        Занять слот на время выполнения промпта (от queue_prompt до получения результата).
+        Возвращает значение флага front для queue_prompt.
+        """
+        priority = Priority(priority)
+        if priority == Priority.INTERACTIVE:
+            front = not self._bulk_starving()
+            if not front:
+                logger.info("Bulk lane is starving, interactive prompt queued without front")
+            self._inflight[priority] += 1
+            try:
+                yield front
+            finally:
+                self._inflight[priority] -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._bulk_lane.append(waiter)
+        self._wake_bulk()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой — вернём его
+            if waiter.done() and not waiter.cancelled():
+                self._inflight[priority] -= 1
+                self._wake_bulk()
+            raise
+
+        # Часы голодания идут с момента, когда промпт уходит в очередь ComfyUI
+        ticket = next(self._counter)
+        self._bulk_submitted_at[ticket] = self._now()
+        try:
+            yield False
+        finally:
+            self._bulk_submitted_at.pop(ticket, None)
+            self._inflight[priority] -= 1
+            self._wake_bulk()
+
+    def stats(self) -> Dict[str, int]:
+        """Текущее состояние полос (для логов и мониторинга)"""
+        return {
+            "interactive_inflight": self._inflight[Priority.INTERACTIVE],
+            "bulk_inflight": self._inflight[Priority.BULK],
+            "bulk_waiting": sum(1 for w in self._bulk_lane if not w.done()),
+        }
+
+
+_default_scheduler: Optional[PromptScheduler] = None
+
+
+def get_prompt_scheduler() -> PromptScheduler:
+    """Общий планировщик процесса (все экземпляры LocalComfyUIClient делят одну очередь ComfyUI)"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = PromptScheduler()
+    return _default_scheduler
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import aiohttp
+
+from config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    COMFYUI_MAX_RETRIES,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    RETRY_BUDGET_MIN,
+    RETRY_BUDGET_RATIO,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TransientHTTPError(RuntimeError):
+    """Ответ ComfyUI со статусом, после которого запрос можно повторить"""
+
+    # 429/503 — сервер отказал, не начиная обработку; прочие 5xx — неизвестно
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+    NOT_ACCEPTED_STATUSES = {429, 503}
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or f"ComfyUI responded with {status}")
+        self.status = status
+
+
+class CircuitOpenError(RuntimeError):
+    """Сервер считается недоступным, запрос не отправлялся"""
+
+
+@dataclass
+class RetryPolicy:
+    """Политика повторов для одной операции"""
+    max_retries: int = COMFYUI_MAX_RETRIES
+    base_delay: float = RETRY_BACKOFF_BASE
+    max_delay: float = RETRY_BACKOFF_MAX
+    # True — операция идемпотентна (/history, /view) и повторяется при любой сетевой ошибке.
+    # False — (/prompt) повтор только если промпт точно не был принят
+    idempotent: bool = True
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: случайная задержка от 0 до min(max_delay, base_delay * 2^attempt)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, TransientHTTPError):
+            statuses = error.RETRYABLE_STATUSES if self.idempotent else error.NOT_ACCEPTED_STATUSES
+            return error.status in statuses
+        if self.idempotent:
+            return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+        # Соединение не установлено — запрос до сервера не дошёл
+        return isinstance(error, aiohttp.ClientConnectorError)
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Сбой сети или сервера (учитывается circuit breaker), в отличие от ошибок запроса"""
+    return isinstance(error, (TransientHTTPError, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+DEFAULT_POLICIES: Dict[str, RetryPolicy] = {
+    "prompt": RetryPolicy(idempotent=False),
+    "history": RetryPolicy(),
+    "view": RetryPolicy(),
+}
+
+
+class RetryBudget:
+    """
+    Глобальный бюджет повторов (token bucket): каждый исходный запрос добавляет
+    ratio токена, каждый повтор забирает один. Повторов не больше ~ratio от трафика,
+    поэтому при массовых сбоях повторы не умножают нагрузку на сервер.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_tokens: int = RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.max_tokens = max(float(min_tokens), 100.0)
+        self.tokens = float(min_tokens)
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            self.exhausted += 1
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для одного ComfyUI сервера.
+
+    closed -> open после failure_threshold подряд сетевых сбоев; в open запросы
+    сразу получают CircuitOpenError. Через reset_timeout пропускается один
+    пробный запрос (half-open): успех закрывает цепь, сбой снова открывает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("ComfyUI backend is unavailable (circuit open)")
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            raise CircuitOpenError("ComfyUI backend is unavailable (probe in progress)")
+        self._probe_in_flight = True
+
+    def release_probe(self) -> None:
+        """Пробный запрос отменён, не дождавшись ответа — следующий сможет стать пробным"""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit opened after %d failures", self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class ResilientTransport:
+    """Выполнение запросов к ComfyUI с повторами, бюджетом и circuit breaker"""
+
+    def __init__(
+            self,
+            breaker: CircuitBreaker,
+            budget: RetryBudget,
+            policies: Optional[Dict[str, RetryPolicy]] = None,
+    ):
+        self.breaker = breaker
+        self.budget = budget
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+
+    async def call(self, operation: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Вызвать fn() по политике операции (prompt/history/view)"""
+        policy = self.policies[operation]
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if is_backend_failure(e):
+                    self.breaker.record_failure()
+                else:
+                    # Сервер ответил (например, 400 на невалидный промпт) — он жив
+                    self.breaker.record_success()
+                if not policy.is_retryable(e) or attempt >= policy.max_retries:
+                    raise
+                # Сбой только что открыл цепь — повтор всё равно получит CircuitOpenError
+                if self.breaker.state == CircuitBreaker.OPEN or not self.budget.withdraw():
+                    raise
+                delay = policy.backoff(attempt)
+                attempt += 1
+                logger.warning("%s failed (%s), retry %d/%d in %.2fs", operation, e, attempt, policy.max_retries, delay)
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_budget: Optional[RetryBudget] = None
+
+
+def get_circuit_breaker(base_url: str) -> CircuitBreaker:
+    """Общий circuit breaker для каждого ComfyUI сервера (на процесс)"""
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        breaker = _breakers[base_url] = CircuitBreaker()
+    return breaker
+
+
+def get_retry_budget() -> RetryBudget:
+    """Общий бюджет повторов процесса"""
+    global _budget
+    if _budget is None:
+        _budget = RetryBudget()
+    return _budget
@@ -1,21 +1,55 @@
 import aiohttp
 import asyncio
 import json
+import time
 import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Union
 import logging
 from PIL import Image
 from io import BytesIO
 import matplotlib.pyplot as plt
 import base64
 from validation.workflow_processor import *
-from config import COMFYUI_HOST, COMFYUI_PORT
+from config import (
+    COMFYUI_HOST,
+    COMFYUI_OUTPUT_ACCESS,
+    COMFYUI_OUTPUT_DIR,
+    COMFYUI_PORT,
+    COMFYUI_REQUEST_TIMEOUT,
+)
+from services.prompt_scheduler import Priority, PromptScheduler, get_prompt_scheduler
+from services.output_storage import LocalOutputStorage, OutputAccess
+from services.cleanup import get_cleanup
+from services.job_ledger import JobLedger, JobRecord, get_job_ledger, params_hash
+from services.resilience import (
+    ResilientTransport,
+    RetryPolicy,
+    TransientHTTPError,
+    get_circuit_breaker,
+    get_retry_budget,
+)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+class OutputImage(BaseModel):
+    """Ссылка на изображение в выводе ComfyUI (параметры для /view)"""
+    filename: str
+    subfolder: str = ""
+    type: str = "output"
+
+
+class WorkflowResult(BaseModel):
+    """Результат выполнения workflow: все изображения ноды сохранения"""
+    prompt_id: str
+    images: List[OutputImage] = Field(default_factory=list)
+    data: List[bytes] = Field(default_factory=list)
+
+
 class LocalComfyUIClient:
     """Клиент для локального ComfyUI сервера"""
 
@@ -23,52 +57,128 @@ class LocalComfyUIClient:
             self,
             host: str = COMFYUI_HOST,
             port: int = COMFYUI_PORT,
-            client_id: str = None
+            client_id: str = None,
+            scheduler: Optional[PromptScheduler] = None,
+            output_access: OutputAccess = COMFYUI_OUTPUT_ACCESS,
+            output_storage: Optional[LocalOutputStorage] = None,
+            ledger: Optional[JobLedger] = None,
+            request_timeout: float = COMFYUI_REQUEST_TIMEOUT,
+            retry_policies: Optional[Dict[str, RetryPolicy]] = None,
     ):
         self.base_url = f"http://{host}:{port}"
         self.ws_url = f"ws://{host}:{port}/ws"
         self.client_id = client_id or str(uuid.uuid4())
         self.node_mapping = NodeMapping()
+        self.scheduler = scheduler or get_prompt_scheduler()
+        # В режиме filesystem файлы читаются с общего диска, /view — только запасной путь
+        self.output_access = OutputAccess(output_access)
+        self.output_storage = None
+        if self.output_access == OutputAccess.FILESYSTEM:
+            self.output_storage = output_storage or LocalOutputStorage()
+        # Политика хранения работает с общим диском и в режиме http, если задан COMFYUI_OUTPUT_DIR
+        retention_storage = self.output_storage
+        if retention_storage is None and COMFYUI_OUTPUT_DIR:
+            retention_storage = LocalOutputStorage(COMFYUI_OUTPUT_DIR)
+        self.cleanup = get_cleanup(self.base_url, retention_storage)
+        self.ledger = ledger or get_job_ledger()
+        # Повторы /prompt, /history, /view: бюджет общий на процесс, breaker — на сервер
+        self.request_timeout = aiohttp.ClientTimeout(total=request_timeout)
+        self.transport = ResilientTransport(
+            breaker=get_circuit_breaker(self.base_url),
+            budget=get_retry_budget(),
+            policies=retry_policies,
+        )
 
-    async def queue_prompt(self, workflow: Dict[str, Any]) -> str:
-        """Отправить промпт в очередь выполнения"""
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                    f"{self.base_url}/prompt",
-                    json={"prompt": workflow}
-            ) as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    raise RuntimeError(f"Failed to queue prompt: {text}")
-                data = await resp.json()
-                return data['prompt_id']
+    async def queue_prompt(self, workflow: Dict[str, Any], front: bool = False) -> str:
+        """Отправить промпт в очередь выполнения (front=True — в начало очереди ComfyUI)"""
+        payload = {"prompt": workflow}
+        if front:
+            payload["front"] = True
+
+        async def post() -> str:
+            async with aiohttp.ClientSession(timeout=self.request_timeout) as session:
+                async with session.post(
+                        f"{self.base_url}/prompt",
+                        json=payload
+                ) as resp:
+                    if resp.status != 200:
+                        text = await resp.text()
+                        if resp.status in TransientHTTPError.RETRYABLE_STATUSES:
+                            raise TransientHTTPError(resp.status, f"Failed to queue prompt: {text}")
+                        raise RuntimeError(f"Failed to queue prompt: {text}")
+                    data = await resp.json()
+                    return data['prompt_id']
+
+        # Повтор только если промпт точно не принят (нет соединения, 429/503)
+        return await self.transport.call("prompt", post)
 
     async def get_history(self, prompt_id: str) -> Optional[Dict]:
         """Получить историю выполнения промпта"""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                    f"{self.base_url}/history/{prompt_id}"
-            ) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                return None
+        async def fetch() -> Optional[Dict]:
+            async with aiohttp.ClientSession(timeout=self.request_timeout) as session:
+                async with session.get(
+                        f"{self.base_url}/history/{prompt_id}"
+                ) as resp:
+                    if resp.status == 200:
+                        return await resp.json()
+                    if resp.status in TransientHTTPError.RETRYABLE_STATUSES:
+                        raise TransientHTTPError(resp.status, f"Failed to get history: {resp.status}")
+                    return None
+
+        return await self.transport.call("history", fetch)
+
+    async def get_image(
+            self,
+            filename: str,
+            subfolder: str = "",
+            type: str = "output",
+            session: Optional[aiohttp.ClientSession] = None,
+    ) -> bytes:
+        """Получить изображение с общего диска или с сервера (можно передать общую сессию)"""
+        if self.output_storage is not None:
+            data = await self.output_storage.read(filename, subfolder, type)
+            if data is not None:
+                return data
+            logger.debug("File %s/%s not found locally, falling back to /view", subfolder, filename)
 
-    async def get_image(self, filename: str, subfolder: str = "", type: str = "output") -> bytes:
-        """Получить изображение с сервера"""
         params = {
             "filename": filename,
             "subfolder": subfolder,
             "type": type
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                    f"{self.base_url}/view",
-                    params=params
-            ) as resp:
-                if resp.status == 200:
-                    return await resp.read()
-                raise RuntimeError(f"Failed to get image: {resp.status}")
+        if session is None:
+            async with aiohttp.ClientSession(timeout=self.request_timeout) as session:
+                return await self.transport.call("view", lambda: self._view(session, params))
+        return await self.transport.call("view", lambda: self._view(session, params))
+
+    async def _view(self, session: aiohttp.ClientSession, params: Dict[str, str]) -> bytes:
+        """Скачать файл через /view"""
+        async with session.get(
+                f"{self.base_url}/view",
+                params=params
+        ) as resp:
+            if resp.status == 200:
+                return await resp.read()
+            if resp.status in TransientHTTPError.RETRYABLE_STATUSES:
+                raise TransientHTTPError(resp.status, f"Failed to get image: {resp.status}")
+            raise RuntimeError(f"Failed to get image: {resp.status}")
+
+    def get_local_path(self, image: OutputImage) -> Optional[Path]:
+        """Путь к изображению на общем диске (None в режиме http или если файла нет)"""
+        if self.output_storage is None:
+            return None
+        return self.output_storage.resolve(image.filename, image.subfolder, image.type)
+
+    async def get_images(self, images: List[OutputImage]) -> List[bytes]:
+        """Параллельно скачать все изображения через одну сессию (пул соединений)"""
+        if not images:
+            return []
+        async with aiohttp.ClientSession(timeout=self.request_timeout) as session:
+            return list(await asyncio.gather(*(
+                self.get_image(image.filename, image.subfolder, image.type, session=session)
+                for image in images
+            )))
 
     async def display_image(self, image: Image.Image) -> None:
         """Отображает изображение"""
@@ -109,6 +219,25 @@ class LocalComfyUIClient:
             logger.error(f"Не удалось извлечь изображение: отсутствует ключ {e}")
             return None, None
 
+    def get_images_from_history(
+            self,
+            history_data: Dict[str, Any],
+            save_node_id: Optional[str] = None,
+    ) -> List[OutputImage]:
+        """Извлекает все изображения ноды сохранения (или всех нод с подпапкой, если нода не задана)"""
+        if save_node_id is not None:
+            outputs = [history_data.get(str(save_node_id), {})]
+        else:
+            outputs = history_data.values()
+
+        images = []
+        for output_data in outputs:
+            for image in output_data.get('images') or []:
+                if save_node_id is None and image.get('subfolder', '') == '':
+                    continue
+                images.append(OutputImage(**image))
+        return images
+
     async def upload_image(self, image_data: bytes, filename: str = "upload.png") -> str:
         """Загрузить изображение на сервер"""
         data = aiohttp.FormData()
@@ -225,49 +354,161 @@ class LocalComfyUIClient:
 
         filename, subfolder = await self.get_image_from_history(outputs)
         img = await self.get_image(filename, subfolder)
+        self.cleanup.schedule(prompt_id)
 
         return img
 
 
+    @contextmanager
+    def track_job(
+            self,
+            process_type: ProcessType,
+            params: dict = None,
+            priority: Priority = Priority.INTERACTIVE,
+    ) -> Iterator[JobRecord]:
+        """Запись о генерации для журнала: итог фиксируется при выходе из блока"""
+        # Хэш от провалидированной модели: неполный dict и полный с умолчаниями совпадают
+        try:
+            canonical = WorkflowFactory.validate_params(process_type, params).model_dump(mode="json")
+        except (ValueError, TypeError):
+            # Невалидные параметры — ошибка будет в run_process, хэшируем как есть
+            canonical = params
+        job = JobRecord(
+            process_type=ProcessType(process_type).value,
+            params_hash=params_hash(canonical),
+            backend=self.base_url,
+            priority=Priority(priority).value,
+        )
+        try:
+            yield job
+            job.outcome = "success"
+        except asyncio.CancelledError:
+            job.outcome = "cancelled"
+            raise
+        except Exception as e:
+            job.outcome = "error"
+            job.error = str(e)[:500]
+            raise
+        finally:
+            if self.ledger is not None:
+                self.ledger.record(job)
+
     async def execute_workflow2(
             self,
             process_type: ProcessType,
             timeout: float = 300.0,
             params: dict = None,
+            priority: Priority = Priority.INTERACTIVE,
+    ) -> str:
+        """Выполнить workflow по типу процесса и вернуть первое изображение в base64"""
+        img = await self.execute_workflow_file(process_type, timeout, params, priority)
+        if isinstance(img, Path):
+            img = await asyncio.to_thread(img.read_bytes)
+        return await self.get_image_base64(img)
 
-    ) -> Dict[str, Any]:
+    async def execute_workflow_file(
+            self,
+            process_type: ProcessType,
+            timeout: float = 300.0,
+            params: dict = None,
+            priority: Priority = Priority.INTERACTIVE,
+    ) -> Union[Path, bytes]:
+        """
+        Выполнить workflow и вернуть первое изображение: путь на общем диске
+        (режим filesystem, файл можно отдать через sendfile) или скачанные байты.
+        """
+        with self.track_job(process_type, params, priority) as job:
+            result = await self.run_process(process_type, timeout, params, priority, job=job)
+            if not result.images:
+                raise RuntimeError("В выводе workflow не найдено изображения")
+            first = result.images[0]
+            path = self.get_local_path(first)
+            if path is not None:
+                return path
+            with job.stage("download"):
+                return await self.get_image(first.filename, first.subfolder or "", first.type)
+
+    async def execute_workflow_batch(
+            self,
+            process_type: ProcessType,
+            timeout: float = 300.0,
+            params: dict = None,
+            priority: Priority = Priority.INTERACTIVE,
+    ) -> WorkflowResult:
+        """Выполнить workflow (params.batch_size изображений за проход) и скачать все изображения"""
+        with self.track_job(process_type, params, priority) as job:
+            result = await self.run_process(process_type, timeout, params, priority, job=job)
+            if not result.images:
+                raise RuntimeError("В выводе workflow не найдено изображения")
+            with job.stage("download"):
+                result.data = await self.get_images(result.images)
+        return result
+
+    async def run_process(
+            self,
+            process_type: ProcessType,
+            timeout: float = 300.0,
+            params: dict = None,
+            priority: Priority = Priority.INTERACTIVE,
+            job: Optional[JobRecord] = None,
+    ) -> WorkflowResult:
+        """
+        Подготовить workflow по типу процесса, выполнить его и собрать ссылки на изображения.
+        Если передан job, в него пишутся тайминги этапов, prompt_id и пути к результатам.
+        """
+        if job is None:
+            job = JobRecord(process_type=ProcessType(process_type).value, params_hash="", backend=self.base_url)
 
         process_name = process_type
-        base_dir = Path(__file__).resolve().parent.parent / "workflows"
-        path_mngr = WorkflowPathManager(base_dir=base_dir)
-        workflow = path_mngr.load_workflow(process_name)
-
-        save_node_id = self.node_mapping.get_save_node_id(process_name)
-        logger.debug("save_node_id=%s", save_node_id)
-        # Обрабатываем workflow
-        processed_workflow = WorkflowFactory.process(
-            process_type=process_name,
-            params=params,
-            workflow_template=workflow
-        )
-
-        # Отправляем промпт
-        prompt_id = await self.queue_prompt(processed_workflow)
-
-        # Ожидаем завершения
-        outputs = await self.wait_for_completion(
-            prompt_id,
-            timeout,
-            progress_callback=None,
-            save_node_id=save_node_id,
-        )
-
-        filename, subfolder = await self.get_image_from_history(outputs)
-        if filename is None:
-            raise RuntimeError("В выводе workflow не найдено изображения")
-        img = await self.get_image(filename, subfolder or "")
-
-        return await self.get_image_base64(img)
+        with job.stage("prepare"):
+            base_dir = Path(__file__).resolve().parent.parent / "workflows"
+            path_mngr = WorkflowPathManager(base_dir=base_dir)
+            workflow = path_mngr.load_workflow(process_name)
+
+            save_node_id = self.node_mapping.get_save_node_id(process_name)
+            logger.debug("save_node_id=%s", save_node_id)
+            # Обрабатываем workflow
+            processed_workflow = WorkflowFactory.process(
+                process_type=process_name,
+                params=params,
+                workflow_template=workflow
+            )
+
+        # Слот планировщика держим до завершения генерации на ComfyUI
+        slot_requested = time.perf_counter()
+        async with self.scheduler.slot(priority) as front:
+            job.timings["scheduler_wait"] = round(time.perf_counter() - slot_requested, 4)
+
+            # Отправляем промпт
+            with job.stage("submit"):
+                prompt_id = await self.queue_prompt(processed_workflow, front=front)
+            job.prompt_id = prompt_id
+
+            # Ожидаем завершения
+            finished = True
+            try:
+                with job.stage("generation"):
+                    outputs = await self.wait_for_completion(
+                        prompt_id,
+                        timeout,
+                        progress_callback=None,
+                        save_node_id=save_node_id,
+                    )
+            except TimeoutError:
+                # Промпт может ещё выполняться — его запись в /history появится позже
+                finished = False
+                raise
+            finally:
+                # Завершённый промпт (успех или execution_error) больше не нужен в /history
+                if finished:
+                    self.cleanup.schedule(prompt_id)
+
+        images = self.get_images_from_history(outputs, save_node_id)
+        if not images:
+            # Нода сохранения не найдена в выводе — ищем по всем нодам
+            images = self.get_images_from_history(outputs)
+        job.outputs = [f"{image.type}/{image.subfolder}/{image.filename}" for image in images]
+        return WorkflowResult(prompt_id=prompt_id, images=images)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,188 @@
+"""
+Заглушка ComfyUI на aiohttp.web для тестов.
+
+- Очередь с одним "GPU"-воркером: промпты выполняются по одному за exec_time секунд,
+  флаг front ставит промпт в начало очереди (как в ComfyUI).
+- /history, /view, /ws (execution_success) в объёме, нужном LocalComfyUIClient.
+  Каждый промпт выдаёт images_per_prompt изображений на ноде save_node;
+  preview_node — дополнительная нода вывода, которую клиент должен игнорировать.
+  Если задан output_dir, файлы изображений пишутся туда (как общий том ComfyUI).
+- Внедрение ошибок: faults[route] — список действий для следующих запросов
+  (HTTP-статус, "timeout" или "disconnect"), hits[route] — число запросов.
+  route: "prompt", "history", "history_delete", "view".
+  faults["execute"] — "error" для следующих промптов: execution_error вместо
+  успеха (запись в /history при этом остаётся, как в ComfyUI).
+"""
+import asyncio
+import io
+import json
+import uuid
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from aiohttp import web
+from PIL import Image
+
+_buffer = io.BytesIO()
+Image.new("RGB", (64, 64)).save(_buffer, format="PNG")
+PNG = _buffer.getvalue()
+
+Fault = Union[int, str]
+
+
+class FakeComfyUI:
+    def __init__(
+            self,
+            exec_time: float = 0.0,
+            hang_time: float = 1.0,
+            images_per_prompt: int = 1,
+            save_node: str = "9",
+            preview_node: Optional[str] = None,
+            output_dir: Optional[Path] = None,
+    ):
+        self.exec_time = exec_time
+        self.hang_time = hang_time
+        self.images_per_prompt = images_per_prompt
+        self.save_node = save_node
+        self.preview_node = preview_node
+        self.output_dir = output_dir
+        self.faults: Dict[str, List[Fault]] = defaultdict(list)
+        self.hits: Counter = Counter()
+        self.accepted: List[Tuple[str, bool]] = []
+        self.history: Dict[str, dict] = {}
+        self.deleted: List[List[str]] = []
+        self._events: Dict[str, str] = {}
+        self._queue: Deque[str] = deque()
+        self._work = asyncio.Event()
+        self._sockets = set()
+        self._runner: Optional[web.AppRunner] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.port: Optional[int] = None
+
+    async def start(self, port: int = 0) -> "FakeComfyUI":
+        app = web.Application()
+        app.router.add_post("/prompt", self._prompt)
+        app.router.add_get("/history/{prompt_id}", self._get_history)
+        app.router.add_post("/history", self._delete_history)
+        app.router.add_get("/view", self._view)
+        app.router.add_get("/ws", self._ws)
+        self._runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        self._worker = asyncio.get_running_loop().create_task(self._run_queue())
+        return self
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+        for ws in list(self._sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _inject(self, route: str, request: web.Request) -> Optional[web.StreamResponse]:
+        self.hits[route] += 1
+        if not self.faults[route]:
+            return None
+        fault = self.faults[route].pop(0)
+        if fault == "timeout":
+            await asyncio.sleep(self.hang_time)
+            return web.Response(status=504)
+        if fault == "disconnect":
+            request.transport.close()
+            return web.Response(status=500)
+        return web.Response(status=int(fault), text=f"injected {fault}")
+
+    async def _prompt(self, request: web.Request) -> web.StreamResponse:
+        if (fault := await self._inject("prompt", request)) is not None:
+            return fault
+        body = await request.json()
+        prompt_id = str(uuid.uuid4())
+        front = bool(body.get("front"))
+        self.accepted.append((prompt_id, front))
+        if front:
+            self._queue.appendleft(prompt_id)
+        else:
+            self._queue.append(prompt_id)
+        self._work.set()
+        return web.json_response({"prompt_id": prompt_id})
+
+    async def _run_queue(self) -> None:
+        while True:
+            while not self._queue:
+                self._work.clear()
+                await self._work.wait()
+            prompt_id = self._queue.popleft()
+            await asyncio.sleep(self.exec_time)
+            if self.faults["execute"] and self.faults["execute"].pop(0) == "error":
+                self.history[prompt_id] = {"outputs": {}, "status": {"status_str": "error"}}
+                await self._broadcast(prompt_id, "execution_error", exception_message="injected error")
+                continue
+            outputs = self._outputs(prompt_id)
+            if self.output_dir is not None:
+                for image in outputs[self.save_node]["images"]:
+                    path = self.output_dir / image["subfolder"] / image["filename"]
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_bytes(PNG)
+            self.history[prompt_id] = {"outputs": outputs, "status": {"status_str": "success"}}
+            await self._broadcast(prompt_id, "execution_success")
+
+    def _outputs(self, prompt_id: str) -> Dict[str, dict]:
+        if self.images_per_prompt == 1:
+            names = [f"{prompt_id}.png"]
+        else:
+            names = [f"{prompt_id}_{i}.png" for i in range(self.images_per_prompt)]
+        outputs = {self.save_node: {"images": [
+            {"filename": name, "subfolder": "FACE", "type": "output"} for name in names
+        ]}}
+        if self.preview_node is not None:
+            outputs[self.preview_node] = {"images": [
+                {"filename": f"{prompt_id}_preview.png", "subfolder": "PREVIEW", "type": "temp"}
+            ]}
+        return outputs
+
+    async def _broadcast(self, prompt_id: str, event: str, **data) -> None:
+        message = json.dumps({"type": event, "data": {"prompt_id": prompt_id, **data}})
+        self._events[prompt_id] = message
+        for ws in list(self._sockets):
+            await ws.send_str(message)
+
+    async def _get_history(self, request: web.Request) -> web.StreamResponse:
+        if (fault := await self._inject("history", request)) is not None:
+            return fault
+        prompt_id = request.match_info["prompt_id"]
+        if prompt_id not in self.history:
+            return web.json_response({})
+        return web.json_response({prompt_id: self.history[prompt_id]})
+
+    async def _delete_history(self, request: web.Request) -> web.StreamResponse:
+        if (fault := await self._inject("history_delete", request)) is not None:
+            return fault
+        body = await request.json()
+        self.deleted.append(list(body.get("delete", [])))
+        for prompt_id in body.get("delete", []):
+            self.history.pop(prompt_id, None)
+        return web.json_response({})
+
+    async def _view(self, request: web.Request) -> web.StreamResponse:
+        if (fault := await self._inject("view", request)) is not None:
+            return fault
+        return web.Response(body=PNG, content_type="image/png")
+
+    async def _ws(self, request: web.Request) -> web.StreamResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.add(ws)
+        # Клиент подключается к /ws после /prompt: досылаем уже завершённые промпты,
+        # чтобы быстрый fake не терял события из-за этой гонки
+        for prompt_id in list(self.history):
+            await ws.send_str(self._events[prompt_id])
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self._sockets.discard(ws)
+        return ws
@@ -0,0 +1,37 @@
+import warnings
+
+from fastapi.testclient import TestClient
+
+from api_integration import api_methods
+from api_integration.profiling import LoopLagMonitor
+from services.job_ledger import InMemoryLedgerBackend, JobLedger, JobRecord
+
+
+def test_lifespan_starts_monitor_and_flushes_on_shutdown(monkeypatch):
+    monitor = LoopLagMonitor(interval=0.01)
+    ledger = JobLedger(InMemoryLedgerBackend(), flush_interval=60)
+    calls = []
+
+    async def fake_stop_cleanups():
+        calls.append(("cleanup", ledger.stats()["buffered"]))
+
+    monkeypatch.setattr(api_methods, "loop_lag_monitor", monitor)
+    monkeypatch.setattr(api_methods, "get_job_ledger", lambda: ledger)
+    monkeypatch.setattr(api_methods, "stop_cleanups", fake_stop_cleanups)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        with TestClient(api_methods.app) as client:
+            assert monitor._task is not None
+            assert client.get("/api/v1/health").status_code == 200
+            client.portal.call(lambda: _record(ledger))
+            assert ledger.stats()["buffered"] == 1
+
+    assert monitor._task is None
+    assert ledger.stats()["written"] == 1
+    # Очистка идёт после сброса журнала
+    assert calls == [("cleanup", 0)]
+
+
+async def _record(ledger: JobLedger) -> None:
+    ledger.record(JobRecord(process_type="pose", params_hash="h", backend="b"))
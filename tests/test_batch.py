@@ -0,0 +1,79 @@
+import asyncio
+import base64
+import functools
+from pathlib import Path
+
+import httpx
+import pytest
+
+from api_integration import api_methods
+from services.workflow_service_v3 import LocalComfyUIClient
+from tests.fake_comfyui import PNG, FakeComfyUI
+from validation.node_mapping import NodeMapping
+from validation.path_manager import WorkflowPathManager
+from validation.workflow_processor import ProcessType, WorkflowFactory
+
+WORKFLOWS = Path(__file__).resolve().parent.parent / "workflows"
+BATCH_NODES = ("170:136", "200:136")
+
+
+@pytest.mark.parametrize("process_type", [
+    ProcessType.PORTRAIT, ProcessType.PORTRAIT_DT, ProcessType.POSE, ProcessType.POSE_DT,
+])
+def test_batch_size_is_set_on_every_latent_node(process_type):
+    template = WorkflowPathManager(base_dir=WORKFLOWS).load_workflow(process_type)
+    workflow = WorkflowFactory.process(process_type, {"batch_size": 3}, template)
+    assert [workflow[node]["inputs"]["batch_size"] for node in BATCH_NODES] == [3, 3]
+
+
+def test_images_from_history_take_only_the_save_node():
+    client = LocalComfyUIClient(host="127.0.0.1", port=1)
+    history = {
+        "244": {"images": [
+            {"filename": f"pose_{i}.png", "subfolder": "POSE", "type": "output"} for i in range(3)
+        ]},
+        "250": {"images": [{"filename": "preview.png", "subfolder": "PREVIEW", "type": "temp"}]},
+        "12": {"text": ["not an image"]},
+    }
+    images = client.get_images_from_history(history, save_node_id="244")
+    assert [image.filename for image in images] == ["pose_0.png", "pose_1.png", "pose_2.png"]
+    assert client.get_images_from_history(history, save_node_id="999") == []
+
+
+class RecordingClient(LocalComfyUIClient):
+    """Запоминает сессию каждого скачивания"""
+    sessions = []
+
+    async def get_image(self, filename, subfolder="", type="output", session=None):
+        self.sessions.append(session)
+        return await super().get_image(filename, subfolder, type, session=session)
+
+
+def test_images_endpoint_downloads_batch_through_one_session(monkeypatch):
+    save_node = NodeMapping.get_save_node_id(ProcessType.POSE)
+
+    async def scenario():
+        fake = await FakeComfyUI(images_per_prompt=3, save_node=save_node, preview_node="250").start()
+        monkeypatch.setattr(
+            api_methods, "LocalComfyUIClient", functools.partial(RecordingClient, host="127.0.0.1", port=fake.port)
+        )
+        RecordingClient.sessions = []
+        try:
+            transport = httpx.ASGITransport(app=api_methods.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://api") as http:
+                response = await http.post("/api/v1/get_pose/images", json={"params": {"batch_size": 3}})
+        finally:
+            await fake.stop()
+        return fake, response
+
+    fake, response = asyncio.run(scenario())
+    assert response.status_code == 200
+    images = response.json()["images"]
+    assert [image["filename"] for image in images] == [
+        f"{response.json()['prompt_id']}_{i}.png" for i in range(3)
+    ]
+    assert all(base64.b64decode(image["image_base64"]) == PNG for image in images)
+    assert fake.hits["view"] == 3
+    assert len(RecordingClient.sessions) == 3
+    assert RecordingClient.sessions[0] is not None
+    assert len({id(session) for session in RecordingClient.sessions}) == 1
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+
+import pytest
+
+from services import cleanup as cleanup_module
+from services import workflow_service_v3
+from services.cleanup import ComfyUICleanup, RetentionPolicy, apply_retention
+from services.workflow_service_v3 import LocalComfyUIClient, ProcessType
+from tests.fake_comfyui import FakeComfyUI
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def output(tmp_path):
+    """Пять файлов по 100 байт: new0 самый новый, new4 самый старый (шаг 10 минут)"""
+    for i in range(5):
+        path = tmp_path / "FACE" / f"new{i}.png"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (NOW - i * 600, NOW - i * 600))
+    (tmp_path / "notes.txt").write_text("not an output")
+    os.utime(tmp_path / "notes.txt", (0, 0))
+    return tmp_path
+
+
+def _left(root):
+    return sorted(p.name for p in root.rglob("*") if p.is_file())
+
+
+@pytest.mark.parametrize("policy, kept", [
+    (RetentionPolicy(max_age=1500, max_files=0, max_bytes=0), ["new0.png", "new1.png", "new2.png"]),
+    (RetentionPolicy(max_age=0, max_files=2, max_bytes=0), ["new0.png", "new1.png"]),
+    (RetentionPolicy(max_age=0, max_files=0, max_bytes=350), ["new0.png", "new1.png", "new2.png"]),
+    (RetentionPolicy(max_age=1500, max_files=4, max_bytes=150), ["new0.png"]),
+])
+def test_retention_keeps_newest_files_within_limits(output, policy, kept):
+    deleted, reclaimed = apply_retention(output, policy, now=NOW)
+    assert _left(output) == sorted(kept + ["notes.txt"])
+    assert (deleted, reclaimed) == (5 - len(kept), (5 - len(kept)) * 100)
+
+
+def _run_with_fake(scenario, **fake_kwargs):
+    async def wrapper():
+        fake = await FakeComfyUI(**fake_kwargs).start()
+        try:
+            return await scenario(fake)
+        finally:
+            await fake.stop()
+
+    return asyncio.run(wrapper())
+
+
+def test_history_deleted_in_one_batch_and_requeued_on_failure():
+    async def scenario(fake):
+        cleanup = ComfyUICleanup(f"http://127.0.0.1:{fake.port}", interval=60, delete_history=True)
+        fake.faults["history_delete"] = [500]
+        for prompt_id in ("a", "b", "c"):
+            cleanup.schedule(prompt_id)
+        await cleanup.run_once()
+        failed = (fake.deleted[:], cleanup.stats.history_errors, sorted(cleanup._pending))
+        await cleanup.stop()
+        return fake, cleanup, failed
+
+    fake, cleanup, failed = _run_with_fake(scenario)
+    assert failed == ([], 1, ["a", "b", "c"])
+    assert fake.hits["history_delete"] == 2
+    assert [sorted(batch) for batch in fake.deleted] == [["a", "b", "c"]]
+    assert cleanup.stats.history_deleted == 3
+    assert not cleanup._pending
+
+
+def test_failed_prompt_history_is_deleted():
+    async def scenario(fake):
+        client = LocalComfyUIClient(host="127.0.0.1", port=fake.port)
+        fake.faults["execute"] = ["error"]
+        with pytest.raises(RuntimeError, match="injected error"):
+            await client.run_process(ProcessType.POSE, 10, {})
+        failed_id = next(iter(fake.history))
+        await client.cleanup.run_once()
+        return fake, failed_id
+
+    fake, failed_id = _run_with_fake(scenario)
+    assert fake.deleted == [[failed_id]]
+    assert fake.history == {}
+
+
+def test_timed_out_prompt_history_is_kept():
+    async def scenario(fake):
+        client = LocalComfyUIClient(host="127.0.0.1", port=fake.port)
+        with pytest.raises(TimeoutError):
+            await client.run_process(ProcessType.POSE, 0.05, {})
+        pending = set(client.cleanup._pending)
+        await client.cleanup.run_once()
+        return fake, pending
+
+    fake, pending = _run_with_fake(scenario, exec_time=0.2)
+    assert pending == set()
+    assert fake.deleted == []
+
+
+def test_retention_uses_output_dir_in_http_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(workflow_service_v3, "COMFYUI_OUTPUT_DIR", str(tmp_path))
+    client = LocalComfyUIClient(host="127.0.0.1", port=2, output_access="http")
+    assert client.output_storage is None
+    assert client.cleanup.output_storage.roots["output"] == tmp_path.resolve()
+
+
+def test_retention_without_output_dir_warns(monkeypatch, caplog):
+    monkeypatch.setattr(cleanup_module.RetentionPolicy, "enabled", property(lambda self: True))
+    with caplog.at_level(logging.WARNING, logger="services.cleanup"):
+        cleanup_module.get_cleanup("http://127.0.0.1:3")
+    assert "output retention is disabled" in caplog.text
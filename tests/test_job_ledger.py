@@ -0,0 +1,117 @@
+import asyncio
+
+import config
+from services.job_ledger import InMemoryLedgerBackend, JobLedger, JobRecord
+from services.workflow_service_v3 import LocalComfyUIClient, ProcessType
+from validation.nodes_settings import PoseParams
+
+
+def test_params_hash_uses_validated_params():
+    client = LocalComfyUIClient(host="127.0.0.1", port=1)
+    hashes = []
+    for params in ({"seed": 5}, PoseParams(seed=5).model_dump()):
+        with client.track_job(ProcessType.POSE, params) as job:
+            pass
+        hashes.append(job.params_hash)
+    with client.track_job(ProcessType.POSE, {"seed": 6}) as other:
+        pass
+    assert hashes[0] == hashes[1]
+    assert other.params_hash != hashes[0]
+
+
+class SlowBackend(InMemoryLedgerBackend):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    async def insert_many(self, documents):
+        await asyncio.sleep(self.delay)
+        await super().insert_many(documents)
+
+
+def test_stop_during_insert_does_not_lose_batch():
+    async def scenario():
+        backend = SlowBackend(delay=0.2)
+        ledger = JobLedger(backend, batch_size=2, flush_interval=10)
+        for i in range(3):
+            ledger.record(JobRecord(process_type="pose", params_hash=str(i), backend="b"))
+        # Первая пачка уже в insert_many, когда приходит stop()
+        await asyncio.sleep(0.05)
+        backend.delay = 0
+        await ledger.stop()
+        return backend, ledger
+
+    backend, ledger = asyncio.run(scenario())
+    assert sorted(d["params_hash"] for d in backend.documents) == ["0", "1", "2"]
+    assert ledger.stats() == {"buffered": 0, "written": 3, "dropped": 0, "failed": 0}
+
+
+def _record(ledger: JobLedger, n: int) -> None:
+    for i in range(n):
+        ledger.record(JobRecord(process_type="pose", params_hash=str(i), backend="b"))
+
+
+def test_flush_when_batch_is_full():
+    async def scenario():
+        backend = InMemoryLedgerBackend()
+        ledger = JobLedger(backend, batch_size=3, flush_interval=60)
+        _record(ledger, 2)
+        await asyncio.sleep(0.05)
+        before = len(backend.documents)
+        _record(ledger, 1)
+        await asyncio.sleep(0.05)
+        after = len(backend.documents)
+        await ledger.stop()
+        return before, after
+
+    assert asyncio.run(scenario()) == (0, 3)
+
+
+def test_flush_on_interval():
+    async def scenario():
+        backend = InMemoryLedgerBackend()
+        ledger = JobLedger(backend, batch_size=100, flush_interval=0.1)
+        _record(ledger, 1)
+        await asyncio.sleep(0.03)
+        before = len(backend.documents)
+        await asyncio.sleep(0.15)
+        after = len(backend.documents)
+        await ledger.stop()
+        return before, after
+
+    assert asyncio.run(scenario()) == (0, 1)
+
+
+def test_full_buffer_drops_and_counts_records():
+    async def scenario():
+        backend = InMemoryLedgerBackend()
+        ledger = JobLedger(backend, batch_size=100, flush_interval=60, max_buffer=2)
+        _record(ledger, 5)
+        stats = ledger.stats()
+        await ledger.stop()
+        return stats, ledger.stats(), backend
+
+    full, stopped, backend = asyncio.run(scenario())
+    assert full == {"buffered": 2, "written": 0, "dropped": 3, "failed": 0}
+    assert stopped == {"buffered": 0, "written": 2, "dropped": 3, "failed": 0}
+    assert [d["params_hash"] for d in backend.documents] == ["0", "1"]
+
+
+class FailingBackend(InMemoryLedgerBackend):
+    async def insert_many(self, documents):
+        raise ConnectionError("mongo is down")
+
+
+def test_backend_errors_count_records_as_failed():
+    async def scenario():
+        ledger = JobLedger(FailingBackend(), batch_size=2, flush_interval=60)
+        _record(ledger, 3)
+        await asyncio.sleep(0.05)
+        await ledger.stop()
+        return ledger.stats()
+
+    assert asyncio.run(scenario()) == {"buffered": 0, "written": 0, "dropped": 0, "failed": 3}
+
+
+def test_mongo_uri_authenticates_against_admin():
+    assert config.get_mongo_uri().endswith(f"/{config.MONGO_DB_NAME}?authSource=admin")
@@ -0,0 +1,105 @@
+import asyncio
+import functools
+
+import httpx
+import pytest
+
+from api_integration import api_methods
+from services.output_storage import LocalOutputStorage
+from services.workflow_service_v3 import LocalComfyUIClient
+from tests.fake_comfyui import PNG, FakeComfyUI
+
+
+@pytest.fixture
+def storage(tmp_path):
+    output, temp = tmp_path / "output", tmp_path / "temp"
+    (output / "FACE").mkdir(parents=True)
+    temp.mkdir()
+    (output / "FACE" / "a.png").write_bytes(PNG)
+    (temp / "t.png").write_bytes(PNG)
+    (tmp_path / "secret.png").write_bytes(b"secret")
+    (output / "FACE" / "link.png").symlink_to(tmp_path / "secret.png")
+    return LocalOutputStorage(output, temp)
+
+
+def test_resolve_finds_files_inside_roots(storage):
+    assert storage.resolve("a.png", "FACE") == storage.roots["output"] / "FACE" / "a.png"
+    assert storage.resolve("t.png", "", "temp") == storage.roots["temp"] / "t.png"
+    assert asyncio.run(storage.read("a.png", "FACE")) == PNG
+
+
+@pytest.mark.parametrize("filename, subfolder, type", [
+    ("../secret.png", "", "output"),
+    ("../../secret.png", "FACE", "output"),
+    ("secret.png", "..", "output"),
+    ("secret.png", "../", "temp"),
+    ("link.png", "FACE", "output"),
+    ("a.png\x00.txt", "FACE", "output"),
+    ("a.png", "FACE\x00", "output"),
+    ("a.png", "FACE", "input"),
+    ("", "FACE", "output"),
+])
+def test_resolve_rejects_paths_outside_root(storage, filename, subfolder, type):
+    assert storage.resolve(filename, subfolder, type) is None
+
+
+def test_resolve_rejects_absolute_filename(storage, tmp_path):
+    assert storage.resolve(str(tmp_path / "secret.png")) is None
+    assert storage.resolve("secret.png", str(tmp_path)) is None
+
+
+def test_missing_file_returns_none(storage):
+    assert storage.resolve("missing.png", "FACE") is None
+    assert storage.resolve("FACE") is None
+    assert asyncio.run(storage.read("missing.png", "FACE")) is None
+
+
+def test_get_image_falls_back_to_view(storage):
+    async def scenario():
+        fake = await FakeComfyUI().start()
+        try:
+            client = LocalComfyUIClient(
+                host="127.0.0.1", port=fake.port, output_access="filesystem", output_storage=storage
+            )
+            local = await client.get_image("a.png", "FACE")
+            hits_after_local = fake.hits["view"]
+            remote = await client.get_image("missing.png", "FACE")
+        finally:
+            await fake.stop()
+        return local, hits_after_local, remote, fake.hits["view"]
+
+    local, hits_after_local, remote, hits = asyncio.run(scenario())
+    assert (local, hits_after_local) == (PNG, 0)
+    assert (remote, hits) == (PNG, 1)
+
+
+@pytest.mark.parametrize("endpoint", [
+    "/api/v1/get_portait/image", "/api/v1/get_pose/image", "/api/v1/get_pose_dt/image",
+])
+def test_image_endpoints_send_file_in_filesystem_mode(tmp_path, monkeypatch, endpoint):
+    output = tmp_path / "output"
+
+    async def scenario():
+        fake = await FakeComfyUI(output_dir=output).start()
+        monkeypatch.setattr(api_methods, "LocalComfyUIClient", functools.partial(
+            LocalComfyUIClient,
+            host="127.0.0.1",
+            port=fake.port,
+            output_access="filesystem",
+            output_storage=LocalOutputStorage(output, None),
+        ))
+        try:
+            transport = httpx.ASGITransport(app=api_methods.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://api") as http:
+                response = await http.post(endpoint, json={"params": {}})
+        finally:
+            await fake.stop()
+        return fake, response
+
+    fake, response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.content == PNG
+    assert response.headers["content-type"] == "image/png"
+    # FileResponse (sendfile) выставляет etag/last-modified, обычный Response — нет
+    assert "etag" in response.headers
+    assert fake.hits["view"] == 0
@@ -0,0 +1,59 @@
+import functools
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api_integration import api_methods
+from api_integration.profiling import ProfilingMiddleware, is_admin
+
+
+def test_is_admin_compares_bytes():
+    assert is_admin("secret", "secret")
+    assert is_admin(b"secret", "secret")
+    assert is_admin("sécret".encode("utf-8"), "sécret")
+    assert not is_admin("wrong", "secret")
+    assert not is_admin(None, "secret")
+    assert not is_admin("secret", "")
+    # Не-ASCII str раньше ронял hmac.compare_digest с TypeError
+    assert not is_admin("\xe9", "secret")
+    assert not is_admin("токен", "secret")
+
+
+def test_profiling_middleware_ignores_non_ascii_token(tmp_path):
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    client = TestClient(ProfilingMiddleware(app, admin_token="secret", profile_dir=str(tmp_path)))
+    response = client.get("/health", headers={"X-Profile": "1", "X-Admin-Token": b"\xe9"})
+    assert response.status_code == 200
+    assert "x-profile-report" not in response.headers
+
+    response = client.get("/health", headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert (tmp_path / f"{response.headers['x-profile-report']}.prof").exists()
+
+
+def test_profiling_requires_truthy_flag(tmp_path):
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    client = TestClient(ProfilingMiddleware(app, admin_token="secret", profile_dir=str(tmp_path)))
+    for flag in ("0", "false", "no", "off", ""):
+        response = client.get("/health", headers={"X-Profile": flag, "X-Admin-Token": "secret"})
+        assert "x-profile-report" not in response.headers, flag
+    for flag in ("1", "true", "Yes"):
+        response = client.get("/health", headers={"X-Profile": flag, "X-Admin-Token": "secret"})
+        assert "x-profile-report" in response.headers, flag
+
+
+def test_admin_endpoint_rejects_non_ascii_token(monkeypatch):
+    monkeypatch.setattr(api_methods, "is_admin", functools.partial(is_admin, admin_token="secret"))
+    client = TestClient(api_methods.app)
+    response = client.get("/api/v1/admin/loop_lag", headers={"X-Admin-Token": b"\xe9"})
+    assert response.status_code == 403
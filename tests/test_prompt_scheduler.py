@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from services.prompt_scheduler import Priority, PromptScheduler
+from services.workflow_service_v3 import LocalComfyUIClient, ProcessType
+from tests.fake_comfyui import FakeComfyUI
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[max(0, int(0.95 * len(ordered) + 0.5) - 1)]
+
+
+def test_bulk_lane_respects_inflight_cap():
+    async def scenario():
+        scheduler = PromptScheduler(max_bulk_inflight=2, starvation_timeout=10)
+        peak = 0
+
+        async def bulk():
+            nonlocal peak
+            async with scheduler.slot(Priority.BULK) as front:
+                assert front is False
+                peak = max(peak, scheduler.stats()["bulk_inflight"])
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(bulk() for _ in range(10)))
+        return peak, scheduler.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats == {"interactive_inflight": 0, "bulk_inflight": 0, "bulk_waiting": 0}
+
+
+def test_draining_bulk_batch_does_not_starve_interactive():
+    """Долгий батч bulk, где каждый промпт сразу выполняется, не лишает интерактивные front"""
+    async def scenario():
+        scheduler = PromptScheduler(max_bulk_inflight=2, starvation_timeout=0.3)
+
+        async def bulk():
+            async with scheduler.slot(Priority.BULK):
+                await asyncio.sleep(0.1)
+
+        batch = [asyncio.create_task(bulk()) for _ in range(20)]
+        fronts = []
+        for _ in range(9):
+            await asyncio.sleep(0.1)
+            async with scheduler.slot(Priority.INTERACTIVE) as front:
+                fronts.append(front)
+        await asyncio.gather(*batch)
+        return fronts
+
+    assert all(asyncio.run(scenario()))
+
+
+def test_bulk_prompt_stuck_in_backend_queue_disables_front():
+    async def scenario():
+        scheduler = PromptScheduler(max_bulk_inflight=1, starvation_timeout=0.1)
+        release = asyncio.Event()
+
+        async def bulk():
+            async with scheduler.slot(Priority.BULK):
+                await release.wait()
+
+        task = asyncio.create_task(bulk())
+        await asyncio.sleep(0)
+        async with scheduler.slot(Priority.INTERACTIVE) as early:
+            pass
+        await asyncio.sleep(0.15)
+        async with scheduler.slot(Priority.INTERACTIVE) as starving:
+            pass
+        release.set()
+        await task
+        async with scheduler.slot(Priority.INTERACTIVE) as after:
+            pass
+        return early, starving, after
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+
+def test_interactive_p95_stays_flat_during_bulk_batch():
+    """Замер на fake-сервере: p95 интерактивных запросов с фоновым батчем ≈ без него"""
+    exec_time = 0.1
+
+    async def measure(with_bulk: bool, starvation_timeout: float = 30):
+        fake = await FakeComfyUI(exec_time=exec_time).start()
+        scheduler = PromptScheduler(max_bulk_inflight=4, starvation_timeout=starvation_timeout)
+        client = LocalComfyUIClient(host="127.0.0.1", port=fake.port, scheduler=scheduler)
+        try:
+            batch = []
+            if with_bulk:
+                batch = [
+                    asyncio.create_task(client.run_process(ProcessType.PORTRAIT, 10, {}, Priority.BULK))
+                    for _ in range(25)
+                ]
+                await asyncio.sleep(exec_time)
+            latencies = []
+            for _ in range(8):
+                start = time.perf_counter()
+                await client.run_process(ProcessType.PORTRAIT, 10, {}, Priority.INTERACTIVE)
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(exec_time)
+            await asyncio.gather(*batch)
+            return _p95(latencies)
+        finally:
+            await fake.stop()
+
+    idle = asyncio.run(measure(with_bulk=False))
+    busy = asyncio.run(measure(with_bulk=True))
+    # Без front (starvation_timeout=0) интерактивный промпт стоит за всеми bulk в очереди
+    fifo = asyncio.run(measure(with_bulk=True, starvation_timeout=0))
+    # С front интерактивный промпт ждёт максимум текущую генерацию на "GPU"
+    assert busy <= idle + exec_time + 0.05, (idle, busy)
+    assert fifo > idle + 2 * exec_time, (idle, fifo)
@@ -0,0 +1,153 @@
+import asyncio
+import socket
+import time
+
+import aiohttp
+import pytest
+
+from services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientTransport,
+    RetryBudget,
+    RetryPolicy,
+    TransientHTTPError,
+)
+from services.workflow_service_v3 import LocalComfyUIClient
+from tests.fake_comfyui import PNG, FakeComfyUI
+
+
+def _client(port: int, breaker=None, budget=None, backoff=None) -> LocalComfyUIClient:
+    """Клиент с собственными breaker/бюджетом и почти нулевыми паузами между повторами"""
+    client = LocalComfyUIClient(host="127.0.0.1", port=port, request_timeout=0.2)
+    policies = {
+        "prompt": RetryPolicy(max_retries=3, base_delay=0.001, idempotent=False),
+        "history": RetryPolicy(max_retries=3, base_delay=0.001),
+        "view": RetryPolicy(max_retries=3, base_delay=0.001),
+    }
+    if backoff is not None:
+        for policy in policies.values():
+            policy.backoff = lambda attempt: backoff
+    client.transport = ResilientTransport(
+        breaker or CircuitBreaker(failure_threshold=100),
+        budget or RetryBudget(ratio=1, min_tokens=100),
+        policies,
+    )
+    return client
+
+
+def _run_with_fake(scenario, **fake_kwargs):
+    async def wrapper():
+        fake = await FakeComfyUI(**fake_kwargs).start()
+        try:
+            return await scenario(fake)
+        finally:
+            await fake.stop()
+
+    return asyncio.run(wrapper())
+
+
+def test_prompt_retried_when_not_accepted():
+    async def scenario(fake):
+        fake.faults["prompt"] = [503, 429]
+        prompt_id = await _client(fake.port).queue_prompt({})
+        return fake, prompt_id
+
+    fake, prompt_id = _run_with_fake(scenario)
+    assert fake.hits["prompt"] == 3
+    assert fake.accepted == [(prompt_id, False)]
+
+
+def test_prompt_retried_on_refused_connection():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    client = _client(port)
+    with pytest.raises(aiohttp.ClientConnectorError):
+        asyncio.run(client.queue_prompt({}))
+    assert client.transport.breaker.failures == 4
+
+
+@pytest.mark.parametrize("fault, error", [
+    (500, TransientHTTPError),
+    ("timeout", asyncio.TimeoutError),
+    ("disconnect", aiohttp.ClientError),
+])
+def test_prompt_not_retried_when_it_may_have_been_accepted(fault, error):
+    async def scenario(fake):
+        fake.faults["prompt"] = [fault]
+        with pytest.raises(error):
+            await _client(fake.port).queue_prompt({})
+        return fake
+
+    fake = _run_with_fake(scenario, hang_time=1.0)
+    assert fake.hits["prompt"] == 1
+
+
+def test_history_and_view_retried_on_502():
+    async def scenario(fake):
+        fake.faults["history"] = [502, 502]
+        fake.faults["view"] = [502]
+        client = _client(fake.port)
+        history = await client.get_history("missing")
+        image = await client.get_image("a.png", "FACE")
+        return fake, history, image
+
+    fake, history, image = _run_with_fake(scenario)
+    assert history == {}
+    assert image == PNG
+    assert fake.hits["history"] == 3
+    assert fake.hits["view"] == 2
+
+
+def test_retry_budget_exhaustion_stops_retries():
+    async def scenario(fake):
+        fake.faults["history"] = [502, 502, 502]
+        budget = RetryBudget(ratio=0, min_tokens=1)
+        with pytest.raises(TransientHTTPError):
+            await _client(fake.port, budget=budget).get_history("missing")
+        return fake, budget
+
+    fake, budget = _run_with_fake(scenario)
+    assert fake.hits["history"] == 2
+    assert budget.exhausted == 1
+
+
+def test_circuit_opens_and_sends_single_half_open_probe():
+    backoff = 0.3
+
+    async def scenario(fake):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        client = _client(fake.port, breaker=breaker, backoff=backoff)
+        fake.faults["history"] = [502, 502]
+
+        start = time.perf_counter()
+        with pytest.raises(TransientHTTPError):
+            await client.get_history("missing")
+        elapsed = time.perf_counter() - start
+        hits_when_opened = fake.hits["history"]
+        state_when_opened = breaker.state
+
+        with pytest.raises(CircuitOpenError):
+            await client.get_history("missing")
+        hits_while_open = fake.hits["history"]
+
+        await asyncio.sleep(0.25)
+        results = await asyncio.gather(
+            client.get_history("missing"),
+            client.get_history("missing"),
+            return_exceptions=True,
+        )
+        return fake, breaker, elapsed, hits_when_opened, state_when_opened, hits_while_open, results
+
+    fake, breaker, elapsed, hits_when_opened, state_when_opened, hits_while_open, results = _run_with_fake(scenario)
+    assert hits_when_opened == 2
+    assert state_when_opened == CircuitBreaker.OPEN
+    # Одна пауза перед вторым запросом; после открытия цепи — без ожидания
+    assert elapsed < 2 * backoff
+    assert hits_while_open == 2
+    # В half-open до сервера доходит ровно один пробный запрос
+    assert fake.hits["history"] == 3
+    assert sorted(type(r).__name__ for r in results) == ["CircuitOpenError", "dict"]
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from aiohttp import web
+from fastapi.testclient import TestClient
+
+from api_integration import api_methods
+from api_integration.replay import endpoint_label, replay
+from api_integration.traffic_capture import TrafficCaptureMiddleware
+
+
+def test_capture_records_validated_params(tmp_path, monkeypatch):
+    async def fake_image(process_type, params, timeout, service, priority):
+        return api_methods.Response(content=b"png", media_type="image/png")
+
+    async def fake_images(process_type, params, timeout, service, priority):
+        return api_methods.ImagesResponse(prompt_id="p", images=[])
+
+    monkeypatch.setattr(api_methods, "_run_workflow_and_return_image", fake_image)
+    monkeypatch.setattr(api_methods, "_run_workflow_and_return_images", fake_images)
+    path = tmp_path / "traffic.jsonl"
+    app = TrafficCaptureMiddleware(
+        api_methods.app,
+        path=str(path),
+        models={"/api/v1/get_pose/image": api_methods.PoseRequest},
+        sample_rate=1.0,
+    )
+    client = TestClient(app)
+    assert client.post("/api/v1/get_pose/image", json={"params": {"seed": 7}}).status_code == 200
+    assert client.post("/api/v1/get_pose/image", json={"params": {"batch_size": 8}}).status_code == 422
+    assert client.post("/api/v1/get_pose/images", json={"params": {}}).status_code == 200
+    app.close()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(records) == 1
+    record = records[0]
+    assert record["e"] == "/api/v1/get_pose/image"
+    # Записан запрос после валидации: со значениями по умолчанию, а не сырое тело
+    assert record["p"] == api_methods.PoseRequest(params={"seed": 7}).model_dump(mode="json")
+
+
+def test_endpoint_labels_separate_image_and_images():
+    assert endpoint_label("/api/v1/get_portait/image") == "portrait/image"
+    assert endpoint_label("/api/v1/get_portait/images") == "portrait/images"
+    assert endpoint_label("/api/v1/other") == "/api/v1/other"
+
+
+def test_paced_replay_counts_queueing_delay():
+    """Сервер отвечает за 0.1с, запросы идут каждые 0.02с при -c 1: очередь растёт"""
+    service_time = 0.1
+
+    async def scenario():
+        async def handler(request):
+            await asyncio.sleep(service_time)
+            return web.Response(body=b"png")
+
+        server = web.Application()
+        server.router.add_post("/api/v1/get_pose/image", handler)
+        runner = web.AppRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        records = [{"t": i * 0.02, "e": "/api/v1/get_pose/image", "p": {}} for i in range(6)]
+        try:
+            paced = await replay(records, f"http://127.0.0.1:{port}", speed=1.0, concurrency=1)
+            max_rate = await replay(records, f"http://127.0.0.1:{port}", speed=None, concurrency=1)
+        finally:
+            await runner.cleanup()
+        return paced["pose/image"]["ok"], max_rate["pose/image"]["ok"]
+
+    paced, max_rate = asyncio.run(scenario())
+    # Последний запрос запланирован на 0.1с, но отправлен только после пяти предыдущих
+    assert max(paced) > 4 * service_time
+    assert max(max_rate) < 2 * service_time
@@ -6,6 +6,7 @@ class NodeMapping:
     """Конфигурация маппинга параметров на ноды ComfyUI"""
 
     # Маппинг для каждого типа процесса
+    # node_id может быть списком, если параметр задаётся сразу в нескольких нодах
     MAPPINGS = {
         ProcessType.POSE: {
             "width": {"node_id": 194, "input_name": "value"},
@@ -17,7 +18,7 @@ class NodeMapping:
             "scheduler": {"node_id": 241, "input_name": "choice"},
             "prompt": {"node_id": 193, "input_name": "text"},
             "negative_prompt": {"node_id": 199, "input_name": "text"},
-
+            "batch_size": {"node_id": ["170:136", "200:136"], "input_name": "batch_size"},
         },
         ProcessType.PORTRAIT: {
             "width": {"node_id": 159, "input_name": "value"},
@@ -29,6 +30,7 @@ class NodeMapping:
             "scheduler": {"node_id": 239, "input_name": "choice"},
             "prompt": {"node_id": 164, "input_name": "text"},
             "negative_prompt": {"node_id": 165, "input_name": "text"},
+            "batch_size": {"node_id": ["170:136", "200:136"], "input_name": "batch_size"},
         }}
 
     MAPPINGS[ProcessType.POSE_DT] = copy.deepcopy(MAPPINGS[ProcessType.POSE])
@@ -18,6 +18,7 @@ class BaseProcessParams(BaseModel):
     seed: int = Field(1)
     sampler: str = Field('dpmpp_2m_sde')
     scheduler: str = Field('karras')
+    batch_size: int = Field(1, ge=1, le=8)
 
 
 class PortraitParams(BaseProcessParams):
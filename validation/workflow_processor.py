@@ -26,18 +26,21 @@ class WorkflowProcessor:
             if param_name == "save_node_id" or "node_id" not in node_info:
                 continue
             if param_name in param_dict and param_dict[param_name] is not None:
-                node_id = str(node_info["node_id"])
+                node_ids = node_info["node_id"]
+                if not isinstance(node_ids, (list, tuple)):
+                    node_ids = [node_ids]
                 input_name = node_info["input_name"]
 
-                # Находим ноду в workflow
-                if node_id in workflow:
-                    # Устанавливаем значение в inputs ноды
-                    if "inputs" not in workflow[node_id]:
-                        workflow[node_id]["inputs"] = {}
+                for node_id in map(str, node_ids):
+                    # Находим ноду в workflow
+                    if node_id in workflow:
+                        # Устанавливаем значение в inputs ноды
+                        if "inputs" not in workflow[node_id]:
+                            workflow[node_id]["inputs"] = {}
 
-                    workflow[node_id]["inputs"][input_name] = param_dict[param_name]
-                else:
-                    print(f"Warning: Node {node_id} not found in workflow")
+                        workflow[node_id]["inputs"][input_name] = param_dict[param_name]
+                    else:
+                        print(f"Warning: Node {node_id} not found in workflow")
 
         return workflow
 
@@ -52,6 +55,16 @@ class WorkflowFactory:
     def create_processor(workflow_template: Dict[str, Any]) -> WorkflowProcessor:
         return WorkflowProcessor(workflow_template)
 
+    @staticmethod
+    def validate_params(process_type: ProcessType, params: Dict[str, Any]) -> BaseProcessParams:
+        """Создает модель параметров для типа процесса (с подстановкой значений по умолчанию)"""
+        if process_type in (ProcessType.PORTRAIT, ProcessType.PORTRAIT_DT):
+            return PortraitParams(**(params or {}))
+        elif process_type in (ProcessType.POSE, ProcessType.POSE_DT):
+            return PoseParams(**(params or {}))
+        else:
+            raise ValueError(f"Unknown process type: {process_type}")
+
     @staticmethod
     def process(
             process_type: ProcessType,
@@ -63,21 +76,8 @@ class WorkflowFactory:
         processor = WorkflowProcessor(workflow_template)
 
         # Создаем соответствующую модель параметров
-        if process_type == ProcessType.PORTRAIT:
-            validated_params = PortraitParams(**params)
-            return processor.process(validated_params, process_type)
-        elif process_type == ProcessType.POSE:
-            validated_params = PoseParams(**params)
-            return processor.process(validated_params, process_type)
-        elif process_type == ProcessType.POSE_DT:
-            validated_params = PoseParams(**params)
-            return processor.process(validated_params, process_type)
-        elif process_type == ProcessType.PORTRAIT_DT:
-            validated_params = PortraitParams(**params)
-            return processor.process(validated_params, process_type)
-        else:
-            raise ValueError(f"Unknown process type: {process_type}")
-
+        validated_params = WorkflowFactory.validate_params(process_type, params)
+        return processor.process(validated_params, process_type)
 
 if __name__ == '__main__':
     print("It`s 'workflow_manager.py'")